@@ -0,0 +1,168 @@
+"""
+Measures FileManager in all three SaveModes against a SimulatedRemoteManager, so runs are the same every time.
+Run from the repository root:
+    python -m Benchmarks.benchmark              Runs it and prints a table
+    python -m Benchmarks.benchmark --save       Also saves the results as the baseline
+    python -m Benchmarks.benchmark --compare    Compares to the saved baseline, exits with 1 if something got worse
+For every mode, file count and file size it times create, write, read, list and delete over every file at once.
+Each gives ops/s, p50/p99 latency of a single call, and how many remote calls one operation took.
+Timings depend on the machine, so compare baselines made on the same one. Remote call counts don't.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Example")) # JsonInterpreter imports TestFormat from there
+
+from CoreFunction.Compression import Compression
+from CoreFunction.FileManager import FileManager, LocalBackend, SaveMode
+from Example.SimulatedRemoteManager import SimulatedRemoteManager
+from JsonInterpreter import JsonInterpreter
+from TestFormat import TestFormat
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+OPERATIONS = ["create", "write", "read", "list", "delete"]
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    """Nearest-rank percentile, in milliseconds."""
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))] * 1000
+
+
+async def timed(call: Callable[[], Awaitable[Any]], latencies: List[float]) -> None:
+    start = time.perf_counter()
+    await call()
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_case(mode: SaveMode, count: int, size: int, args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """Runs every operation on `count` files of about `size` bytes. Gives back operation -> measurements."""
+    remote = SimulatedRemoteManager(latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth, seed=0,
+                                    max_concurrent=args.max_concurrent, retry_after=args.retry_after)
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as base_dir:
+        file_manager = FileManager(JsonInterpreter(),
+                                   base_dir=None if mode == SaveMode.remote_only else base_dir,
+                                   remote_manager=None if mode == SaveMode.local_only else remote,
+                                   local_backend=LocalBackend[args.local_backend] if mode == SaveMode.local_only else LocalBackend.files,
+                                   compression=Compression[args.compression] if args.compression else None)
+        names = [f"file{i}" for i in range(count)]
+        data = TestFormat(info1="bench", info2=size, info3=["x" * size])
+
+        operations: Dict[str, Callable[[str], Awaitable[Any]]] = {
+            "create": file_manager.create,
+            "write": lambda name: file_manager.write(name, data),
+            "read": file_manager.read,
+            "delete": file_manager.delete,
+        }
+        for operation in OPERATIONS:
+            remote.reset_calls()
+            latencies: List[float] = []
+            start = time.perf_counter()
+            if operation == "list": # One call for every file
+                await timed(file_manager.list_file_contents, latencies)
+            else:
+                await asyncio.gather(*(timed(lambda name=name: operations[operation](name), latencies) for name in names))
+            elapsed = time.perf_counter() - start
+
+            results[operation] = {
+                "ops_per_s": round(count / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "remote_calls_per_op": round(sum(remote.calls.values()) / count, 3),
+            }
+        await file_manager.aclose()
+    remote.close()
+    return results
+
+
+async def run_all(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """Gives back "mode/countxsize/operation" -> measurements."""
+    results = {}
+    for mode_name in args.modes:
+        mode = SaveMode[mode_name]
+        for count in args.counts:
+            for size in args.sizes:
+                case = await run_case(mode, count, size, args)
+                label = f"{mode_name}+{args.local_backend}" if mode == SaveMode.local_only and args.local_backend != "files" else mode_name
+                if args.compression:
+                    label += f"+{args.compression}"
+                for operation, measurements in case.items():
+                    results[f"{label}/{count}x{size}/{operation}"] = measurements
+    return results
+
+
+def print_table(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'case':<40}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'calls/op':>10}")
+    for case, m in results.items():
+        print(f"{case:<40}{m['ops_per_s']:>12}{m['p50_ms']:>10}{m['p99_ms']:>10}{m['remote_calls_per_op']:>10}")
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Gives back what got worse: ops/s dropping more than tolerance (a fraction), or any more remote calls per operation.
+    Cases that aren't in both are skipped.
+    """
+    regressions = []
+    for case, m in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        if m["ops_per_s"] < old["ops_per_s"] * (1 - tolerance):
+            regressions.append(f"{case}: {old['ops_per_s']} -> {m['ops_per_s']} ops/s")
+        if m["remote_calls_per_op"] > old["remote_calls_per_op"]:
+            regressions.append(f"{case}: {old['remote_calls_per_op']} -> {m['remote_calls_per_op']} remote calls per op")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks FileManager against a simulated remote.")
+    parser.add_argument("--modes", nargs="+", default=[mode.name for mode in SaveMode], choices=[mode.name for mode in SaveMode])
+    parser.add_argument("--counts", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[128, 16 * 1024], help="About how many bytes each file is")
+    parser.add_argument("--local-backend", default=LocalBackend.files.name, choices=[backend.name for backend in LocalBackend],
+                        help="How local_only keeps its files")
+    parser.add_argument("--compression", default=None, choices=[codec.name for codec in Compression])
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds every remote call waits")
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--bandwidth", type=float, default=None, help="Remote bytes per second, none by default")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Remote calls at once before the remote starts rate limiting, no limit by default")
+    parser.add_argument("--retry-after", type=float, default=None, help="Seconds the rate limit errors say to wait")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare to the baseline, exit with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="How much slower (as a fraction) still passes")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_all(args))
+    print_table(results)
+
+    exit_code = 0
+    if args.compare:
+        saved = json.loads(args.baseline.read_text())
+        if saved["settings"] != {"latency": args.latency, "jitter": args.jitter, "bandwidth": args.bandwidth}:
+            print(f"\nThe baseline was made with other remote settings: {saved['settings']}")
+        regressions = compare(results, saved["results"], args.tolerance)
+        print("\nRegressions:\n  " + "\n  ".join(regressions) if regressions else "\nNo regressions against the baseline.")
+        exit_code = 1 if regressions else 0
+
+    if args.save:
+        args.baseline.write_text(json.dumps({
+            "machine": f"{platform.platform()}, Python {platform.python_version()}",
+            "settings": {"latency": args.latency, "jitter": args.jitter, "bandwidth": args.bandwidth},
+            "results": results,
+        }, indent=4))
+        print(f"\nSaved the baseline to {args.baseline}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Micro-benchmarks of FileInterpreters alone (no FileManager, no I/O): JsonInterpreter against DataclassInterpreter
+with every JSON backend that is installed, compact and indented.
+Run from the repository root:
+    python -m Benchmarks.interpreters
+Prints microseconds per write and per read of one record, and how big the record is, for a flat TestFormat
+and for a record with nested dataclasses.
+"""
+import argparse
+import sys
+import timeit
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Example")) # JsonInterpreter imports TestFormat from there
+
+from CoreFunction.DataclassInterpreter import DataclassInterpreter, JsonBackend, OrjsonBackend, StdlibJsonBackend, orjson
+from CoreFunction.FileFormatABC import FileFormat
+from CoreFunction.FileInterpreterABC import FileInterpreter
+from JsonInterpreter import JsonInterpreter
+from TestFormat import TestFormat
+
+
+@dataclass
+class Address:
+    street: str
+    city: str
+    zip_code: str
+
+
+@dataclass
+class Person(FileFormat):
+    """Something more like a real record: nested dataclasses, a list of them, and a few plain fields."""
+    name: str
+    age: int
+    home: Address
+    past: List[Address] = field(default_factory=list)
+    tags: List[str] = field(default_factory=list)
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+def records() -> Dict[str, FileFormat]:
+    return {
+        "flat": TestFormat(info1="some text", info2=42, info3=[1, 2.5, "three", None, [4, 5]]),
+        "nested": Person(name="Ada", age=36, home=Address("1 Main St", "London", "N1"),
+                         past=[Address(f"{i} Side St", "Paris", f"75{i:03d}") for i in range(5)],
+                         tags=["math", "engines"], scores={"a": 1.5, "b": 2.0}),
+    }
+
+
+def interpreters(record: FileFormat) -> List[Tuple[str, FileInterpreter]]:
+    backends: List[Tuple[str, JsonBackend]] = [("json", StdlibJsonBackend())]
+    if orjson is not None:
+        backends.append(("orjson", OrjsonBackend()))
+    found: List[Tuple[str, FileInterpreter]] = []
+    if isinstance(record, TestFormat): # JsonInterpreter only knows TestFormat
+        found.append(("JsonInterpreter", JsonInterpreter()))
+    for backend_name, backend in backends:
+        for compact in (False, True):
+            found.append((f"Dataclass/{backend_name}/{'compact' if compact else 'indented'}",
+                          DataclassInterpreter(type(record), compact=compact, backend=backend)))
+    return found
+
+
+def measure(interpreter: FileInterpreter, record: FileFormat, number: int) -> Dict[str, Any]:
+    written = interpreter.write(record)
+    write = min(timeit.repeat(lambda: interpreter.write(record), number=number, repeat=5)) / number
+    read = min(timeit.repeat(lambda: interpreter.read(written), number=number, repeat=5)) / number
+    return {"write_us": write * 1e6, "read_us": read * 1e6, "bytes": len(written.encode() if isinstance(written, str) else written)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Times FileInterpreters on one record at a time.")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing")
+    args = parser.parse_args()
+
+    print(f"{'record':<8}{'interpreter':<34}{'write us':>10}{'read us':>10}{'bytes':>8}")
+    for record_name, record in records().items():
+        baseline = None
+        for name, interpreter in interpreters(record):
+            m = measure(interpreter, record, args.number)
+            baseline = baseline or m
+            speedup = f"  ({baseline['write_us'] / m['write_us']:.1f}x / {baseline['read_us'] / m['read_us']:.1f}x)"
+            print(f"{record_name:<8}{name:<34}{m['write_us']:>10.2f}{m['read_us']:>10.2f}{m['bytes']:>8}{speedup}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import codecs
+import lzma
+import zlib
+from enum import Enum
+from typing import Iterable, Iterator
+
+from CoreFunction.FileFormatABC import FileFormat
+from CoreFunction.FileInterpreterABC import FileInterpreter
+
+
+class Compression(Enum):
+    """What FileManager(compression=...) packs files with. The value is the byte saved in every compressed file's header."""
+    zlib = 1 # Fast, and good enough for text. Levels 0 to 9
+    lzma = 2 # Smaller, a lot slower. Levels (presets) 0 to 9
+
+
+class CompressedInterpreter(FileInterpreter):
+    """
+    Wraps another FileInterpreter so what it writes is compressed before it goes anywhere (disk and remote),
+    and decompressed again before it reads. FileManager makes one when given compression, you shouldn't need to.
+    Compressed files start with MAGIC and a byte saying which Compression, so files written before compression was
+    turned on (or with another codec) still read fine. Those stay as they are until they are written again.
+    The header starts with a NUL, which text never does, so an old text file can't be mistaken for a compressed one.
+    Always binary: the compressed bytes are what get hashed and compared between local and remote.
+    """
+    binary = True
+    MAGIC = b"\x00FMC"
+    HEADER_SIZE = len(MAGIC) + 1
+
+    def __init__(self, interpreter: FileInterpreter, compression: Compression, level: int | None = None) -> None:
+        """
+        :param interpreter: What actually turns FileFormats into text (or bytes) and back.
+        :param compression: Which codec new writes use.
+        :param level: 0 (fastest) to 9 (smallest). None is the codec's default (6 for both).
+        """
+        if level is not None and not 0 <= level <= 9:
+            raise ValueError("The compression level has to be between 0 and 9.")
+        self.interpreter = interpreter
+        self.compression = compression
+        self.level = level if level is not None else 6
+
+    @property
+    def extension(self) -> str:
+        return self.interpreter.extension # Same names as before, so old files are still found
+
+    def _compressor(self):
+        if self.compression == Compression.zlib:
+            return zlib.compressobj(self.level)
+        return lzma.LZMACompressor(preset=self.level)
+
+    @staticmethod
+    def _decompressor(compression: Compression):
+        if compression == Compression.zlib:
+            return zlib.decompressobj()
+        return lzma.LZMADecompressor()
+
+    def _header(self) -> bytes:
+        return self.MAGIC + bytes([self.compression.value])
+
+    def _sniff(self, head: bytes) -> Compression | None:
+        """Which Compression a file starting with head used, or None if it isn't compressed."""
+        if len(head) < self.HEADER_SIZE or head[:len(self.MAGIC)] != self.MAGIC:
+            return None
+        try:
+            return Compression(head[len(self.MAGIC)])
+        except ValueError:
+            raise ValueError(f"File is compressed with an unknown codec ({head[len(self.MAGIC)]})") from None
+
+    def _unwrap(self, contents: bytes | memoryview) -> str | bytes:
+        """What the wrapped interpreter reads: the contents decompressed (if they were), and decoded for a text interpreter."""
+        compression = self._sniff(bytes(contents[:self.HEADER_SIZE]))
+        if compression is not None:
+            decompressor = self._decompressor(compression)
+            contents = decompressor.decompress(contents[self.HEADER_SIZE:])
+            if compression == Compression.zlib:
+                contents += decompressor.flush()
+        if self.interpreter.binary:
+            return contents
+        return str(contents, "utf-8")
+
+    def write(self, formatted: FileFormat) -> bytes:
+        contents = self.interpreter.write(formatted)
+        compressor = self._compressor()
+        return self._header() + compressor.compress(contents if self.interpreter.binary else contents.encode()) + compressor.flush()
+
+    def read(self, file_contents: bytes | memoryview) -> FileFormat:
+        return self.interpreter.read(self._unwrap(file_contents))
+
+    def write_chunks(self, formatted: FileFormat) -> Iterator[bytes]:
+        """Compresses the wrapped interpreter's chunks as they come."""
+        compressor = self._compressor()
+        yield self._header()
+        for chunk in self.interpreter.write_chunks(formatted):
+            if compressed := compressor.compress(chunk if self.interpreter.binary else chunk.encode()):
+                yield compressed
+        yield compressor.flush()
+
+    def read_chunks(self, file_chunks: Iterable[bytes]) -> FileFormat:
+        """Decompresses (and decodes) the chunks as they come, and gives them to the wrapped interpreter's read_chunks."""
+        return self.interpreter.read_chunks(self._unwrap_chunks(iter(file_chunks)))
+
+    def _unwrap_chunks(self, file_chunks: Iterator[bytes]) -> Iterator[str | bytes]:
+        head = b""
+        for chunk in file_chunks: # The header might be split over the first few chunks
+            head += chunk
+            if len(head) >= self.HEADER_SIZE:
+                break
+        compression = self._sniff(head)
+
+        def raw() -> Iterator[bytes]:
+            if compression is None:
+                yield head
+                yield from file_chunks
+                return
+            decompressor = self._decompressor(compression)
+            yield decompressor.decompress(head[self.HEADER_SIZE:])
+            for chunk in file_chunks:
+                yield decompressor.decompress(chunk)
+            if compression == Compression.zlib:
+                yield decompressor.flush()
+
+        if self.interpreter.binary:
+            yield from raw()
+            return
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in raw():
+            if text := decoder.decode(chunk):
+                yield text
+        if text := decoder.decode(b"", final=True):
+            yield text
@@ -0,0 +1,245 @@
+import dataclasses
+import json
+import threading
+import types
+import typing
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Type
+
+from CoreFunction.FileFormatABC import FileFormat
+from CoreFunction.FileInterpreterABC import FileInterpreter
+
+try:
+    import orjson
+except ImportError: # Optional, only for OrjsonBackend
+    orjson = None
+
+
+class JsonBackend(ABC):
+    """
+    What DataclassInterpreter turns plain dicts/lists into JSON with, and back.
+    Subclass it to plug in another library. binary says if dumps gives bytes (then the interpreter is binary too,
+    so nothing gets decoded on the way to the disk or remote).
+    """
+    binary: bool = False
+
+    @abstractmethod
+    def dumps(self, data: Any, compact: bool) -> str | bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, contents: str | bytes | memoryview) -> Any:
+        pass
+
+    def dumps_chunks(self, data: Any, compact: bool) -> Iterator[str | bytes]:
+        """Same as dumps, in pieces. By default it's dumps in one piece."""
+        yield self.dumps(data, compact)
+
+    @property
+    def accepts_dataclasses(self) -> bool:
+        """If dumps can take dataclass instances straight (and does it faster than a dict of them)."""
+        return False
+
+
+class StdlibJsonBackend(JsonBackend):
+    """The json module. Pretty output uses indent=4, like JsonInterpreter."""
+    def dumps(self, data: Any, compact: bool) -> str:
+        return json.dumps(data, separators=(",", ":")) if compact else json.dumps(data, indent=4)
+
+    def loads(self, contents: str | bytes | memoryview) -> Any:
+        return json.loads(contents)
+
+    def dumps_chunks(self, data: Any, compact: bool) -> Iterator[str]:
+        encoder = json.JSONEncoder(separators=(",", ":")) if compact else json.JSONEncoder(indent=4)
+        return encoder.iterencode(data)
+
+
+class OrjsonBackend(JsonBackend):
+    """
+    orjson, several times faster than the json module both ways. Needs `pip install orjson`.
+    Pretty output is indented by 2 (all orjson can do). Integers past 64 bits can't be written.
+    """
+    binary = True
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise ImportError("OrjsonBackend needs orjson: pip install orjson")
+
+    def dumps(self, data: Any, compact: bool) -> bytes:
+        return orjson.dumps(data) if compact else orjson.dumps(data, option=orjson.OPT_INDENT_2)
+
+    def loads(self, contents: str | bytes | memoryview) -> Any:
+        return orjson.loads(contents)
+
+    @property
+    def accepts_dataclasses(self) -> bool:
+        return True
+
+
+def best_backend() -> JsonBackend:
+    """The fastest JsonBackend that is installed."""
+    return OrjsonBackend() if orjson is not None else StdlibJsonBackend()
+
+
+class _Codec:
+    """The made-to-fit encode (dataclass -> dict) and decode (dict -> dataclass) of one dataclass type."""
+    encode: Callable[[Any], Dict[str, Any]]
+    decode: Callable[[Dict[str, Any]], Any]
+
+
+_codecs: Dict[type, _Codec] = {} # Only built codecs, so the unlocked lookup in codec_for never sees a half-made one
+_codecs_lock = threading.RLock() # Re-entrant, building one codec builds the nested ones
+_building: Dict[type, _Codec] = {} # Codecs still being built, only touched under _codecs_lock
+
+
+def codec_for(cls: type) -> _Codec:
+    """The codec of a dataclass type, made (and compiled) the first time it's asked for, then kept."""
+    codec = _codecs.get(cls)
+    if codec is not None:
+        return codec
+    with _codecs_lock:
+        codec = _codecs.get(cls) or _building.get(cls) # Dataclasses that hold themselves (like a tree) find theirs here
+        if codec is not None:
+            return codec
+        outermost = not _building
+        codec = _Codec()
+        _building[cls] = codec
+        try:
+            _build(cls, codec)
+        except BaseException:
+            if outermost:
+                _building.clear()
+            raise
+        if outermost:
+            # Nested codecs can point back at ones still being built, so they're all published together once every one is
+            _codecs.update(_building)
+            _building.clear()
+        return codec
+
+
+def _build(cls: type, codec: _Codec) -> None:
+    """
+    Writes the source of an encode and a decode that go straight at the fields of cls (no fields() call, no loops),
+    and compiles them. Nested dataclasses (also in Optional, lists and dicts) go through their own codecs.
+    """
+    hints = typing.get_type_hints(cls)
+    namespace: Dict[str, Any] = {"cls": cls}
+    encoded: List[str] = []
+    required: List[str] = []
+    optional: List[str] = []
+    for field in dataclasses.fields(cls):
+        hint = hints.get(field.name, Any)
+        key = repr(field.name)
+        to_dict = _converter(hint, f"obj.{field.name}", "encode", namespace, 0)
+        encoded.append(f"{key}: {to_dict or f'obj.{field.name}'}")
+        if not field.init:
+            continue
+        from_dict = _converter(hint, f"data[{key}]", "decode", namespace, 0) or f"data[{key}]"
+        if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING:
+            required.append(f"{field.name}={from_dict}")
+        else:
+            optional.append(f"    if {key} in data:\n        extra[{key}] = {from_dict}")
+
+    source = f"def encode(obj):\n    return {{{', '.join(encoded)}}}\n\n"
+    source += "def decode(data):\n"
+    if optional:
+        source += "    extra = {}\n" + "\n".join(optional) + "\n"
+        source += f"    return cls({', '.join(required + ['**extra'])})\n"
+    else:
+        source += f"    return cls({', '.join(required)})\n"
+    exec(compile(source, f"<codec for {cls.__qualname__}>", "exec"), namespace)
+    codec.encode = namespace["encode"]
+    codec.decode = namespace["decode"]
+
+
+def _converter(hint: Any, expr: str, direction: str, namespace: Dict[str, Any], depth: int) -> str | None:
+    """
+    Source for turning expr (of type hint) to plain JSON data or back (direction "encode" or "decode").
+    None if it doesn't need it (str, int, lists of them, Any...).
+    """
+    if dataclasses.is_dataclass(hint) and isinstance(hint, type):
+        name = f"codec{len(namespace)}"
+        namespace[name] = codec_for(hint)
+        return f"{name}.{direction}({expr})"
+
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin in (typing.Union, types.UnionType):
+        others = [arg for arg in args if arg is not type(None)]
+        if len(others) == 1 and len(args) == 2: # Optional[X]
+            inner = _converter(others[0], expr, direction, namespace, depth)
+            return None if inner is None else f"(None if {expr} is None else {inner})"
+        return None
+
+    item = f"item{depth}"
+    if origin in (list, tuple, set, frozenset) and args:
+        if origin is tuple and not (len(args) == 2 and args[1] is Ellipsis):
+            return None # Fixed-size tuples of mixed types, leave them be
+        inner = _converter(args[0], item, direction, namespace, depth + 1)
+        if inner is None:
+            return None
+        if direction == "decode" and origin is not list:
+            return f"{origin.__name__}({inner} for {item} in {expr})"
+        return f"[{inner} for {item} in {expr}]"
+    if origin is dict and len(args) == 2:
+        inner = _converter(args[1], item, direction, namespace, depth + 1)
+        if inner is None:
+            return None
+        return f"{{key{depth}: {inner} for key{depth}, {item} in {expr}.items()}}"
+    return None
+
+
+class DataclassInterpreter(FileInterpreter):
+    """
+    A FileInterpreter for any FileFormat dataclass, so you don't have to write one.
+    The first time a type is used, an encoder and decoder are written just for it and compiled (see codec_for), so reading
+    and writing don't look through the fields every time. Nested dataclass fields work, also inside Optional, lists and dicts.
+    Reading ignores keys the dataclass doesn't have, and fields with a default can be left out of the file.
+    With the default backend (the fastest one installed) files are the same JSON as JsonInterpreter's, and either can read
+    the other's.
+    """
+    def __init__(self, file_format: Type[FileFormat], compact: bool = True, backend: JsonBackend | None = None,
+                 extension: str = ".json") -> None:
+        """
+        :param file_format: The FileFormat dataclass every file holds.
+        :param compact: Write without spaces or newlines. False indents it to be read by people.
+        :param backend: The JSON library to use. None picks the fastest one installed (orjson, else the json module).
+        :param extension: What file names end in.
+        """
+        if not dataclasses.is_dataclass(file_format):
+            raise TypeError(f"{file_format.__name__} isn't a dataclass.")
+        self.file_format = file_format
+        self.compact = compact
+        self.backend = backend if backend is not None else best_backend()
+        self.binary = self.backend.binary
+        self._extension = extension
+        self._codec = codec_for(file_format)
+        # Straight to the backend when it can take the dataclass itself
+        self._direct = self.backend.accepts_dataclasses
+
+    @property
+    def extension(self) -> str:
+        return self._extension
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Compiled functions can't be pickled (for CodecPolicy.process), the codec is found again on the other side."""
+        state = self.__dict__.copy()
+        del state["_codec"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._codec = codec_for(self.file_format)
+
+    def write(self, formatted: FileFormat) -> str | bytes:
+        return self.backend.dumps(formatted if self._direct else self._codec.encode(formatted), self.compact)
+
+    def write_chunks(self, formatted: FileFormat) -> Iterator[str | bytes]:
+        return self.backend.dumps_chunks(formatted if self._direct else self._codec.encode(formatted), self.compact)
+
+    def read(self, file_contents: str | bytes | memoryview) -> FileFormat:
+        data = self.backend.loads(file_contents)
+        try:
+            return self._codec.decode(data)
+        except KeyError as e:
+            raise TypeError(f"The file is missing {self.file_format.__name__}'s field {e}") from None
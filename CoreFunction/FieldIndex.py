@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Set, Type
+
+from CoreFunction.FileFormatABC import FileFormat
+from CoreFunction.JsonJournal import JsonJournal
+
+
+class FieldIndex:
+    """
+    Remembers the value of some FileFormat fields for every file, so FileManager.find/query only read the files that match.
+    Which fields: the ones marked field(metadata={"index": True}) on the FileFormat given.
+    Give one to FileManager. It keeps the index up to date on write and delete, and saves it in base_dir/.filemanager
+    (remote_only has nowhere to save it, so give it a path, or it is rebuilt the first time it's used).
+    Files changed without FileManager aren't seen: use FileManager.check_index or rebuild_index for that.
+    """
+    def __init__(self, file_format: Type[FileFormat], path: str | Path | None = None) -> None:
+        """
+        :param file_format: The FileFormat your interpreter gives back, with at least one indexed field.
+        :param path: Where to save the index. Leave it as None to let FileManager pick.
+        """
+        self.fields = file_format.indexed_fields()
+        if not self.fields:
+            raise ValueError(f"{file_format.__name__} has no indexed fields. Mark some with field(metadata={{\"index\": True}})")
+        self.journal: JsonJournal | None = None
+        self.state_path: Path | None = None
+        self.ready = False # False until the index is known to cover every file, then find/query trust it
+        self._entries: Dict[str, Dict[str, Any]] = {} # file name -> {"keys": {field: key}, "stamp": ...}
+        self._postings: Dict[str, Dict[str, Set[str]]] = {name: {} for name in self.fields} # field -> key -> file names
+        if path is not None:
+            self.open(path)
+
+    @staticmethod
+    def key(value: Any) -> str:
+        """Turns a field value into something to look up by. Equal values give equal keys, even lists and dicts."""
+        return json.dumps(value, sort_keys=True, default=repr)
+
+    def open(self, path: str | Path) -> None:
+        """Loads (or starts) the index saved at path. Only trusted if it was made for the same fields."""
+        self.journal = JsonJournal(path)
+        self.state_path = Path(path).with_suffix(".state.json")
+        self._entries.clear()
+        self._postings = {name: {} for name in self.fields}
+
+        state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        self.ready = state.get("fields") == self.fields
+        if not self.ready:
+            self.journal.clear() # Made for other fields (or never finished), so none of it can be trusted
+            return
+        for file_name, entry in self.journal.items():
+            self._add(file_name, entry)
+
+    def _add(self, file_name: str, entry: Dict[str, Any]) -> None:
+        self._entries[file_name] = entry
+        for field_name, key in entry["keys"].items():
+            self._postings[field_name].setdefault(key, set()).add(file_name)
+
+    def _drop(self, file_name: str) -> None:
+        entry = self._entries.pop(file_name, None)
+        if entry is None:
+            return
+        for field_name, key in entry["keys"].items():
+            names = self._postings[field_name][key]
+            names.discard(file_name)
+            if not names:
+                del self._postings[field_name][key]
+
+    def keys_of(self, formatted: FileFormat) -> Dict[str, str]:
+        return {field_name: self.key(getattr(formatted, field_name)) for field_name in self.fields}
+
+    def update(self, file_name: str, formatted: FileFormat, stamp: Any = None) -> None:
+        """
+        Indexes formatted as the contents of file_name.
+        :param stamp: Something that changes when the file does (FileManager uses mtime and size), so check_index can
+            skip reading files that haven't changed. None means it always has to read it.
+        """
+        entry = {"keys": self.keys_of(formatted), "stamp": stamp}
+        self._drop(file_name)
+        self._add(file_name, entry)
+        if self.journal is not None:
+            self.journal.set(file_name, entry)
+
+    def remove(self, file_name: str) -> None:
+        self._drop(file_name)
+        if self.journal is not None:
+            self.journal.delete(file_name)
+
+    def entry(self, file_name: str) -> Dict[str, Any] | None:
+        return self._entries.get(file_name)
+
+    def names(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def lookup(self, criteria: Mapping[str, Any]) -> Set[str]:
+        """File names whose indexed fields equal every value in criteria."""
+        if not criteria:
+            raise ValueError("Give at least one field to look up.")
+        unknown = [field_name for field_name in criteria if field_name not in self._postings]
+        if unknown:
+            raise ValueError(f"Not indexed: {', '.join(unknown)}. Indexed fields are: {', '.join(self.fields)}")
+        # Smallest set first, so the intersection never gets bigger than it needs to be
+        matches: List[Set[str]] = sorted((self._postings[field_name].get(self.key(value), set()) for field_name, value in criteria.items()), key=len)
+        return set(matches[0]).intersection(*matches[1:])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._postings = {name: {} for name in self.fields}
+        self.set_ready(False)
+        if self.journal is not None:
+            self.journal.clear()
+
+    def set_ready(self, ready: bool) -> None:
+        """Marks the index as covering every file (or not). Saved, so the next FileManager doesn't rebuild it."""
+        self.ready = ready
+        if self.state_path is not None:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.state_path.write_text(json.dumps({"fields": self.fields if ready else None}))
+
+    def __len__(self) -> int:
+        return len(self._entries)
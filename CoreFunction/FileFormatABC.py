@@ -1,5 +1,6 @@
 from abc import ABC
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from typing import List
 
 
 @dataclass
@@ -8,5 +9,10 @@ class FileFormat(ABC):
     Implement to hold all file data.
     Passed from FileReader, and to FileWriter
     Intended to be made only outside FileManager to write.
+    Mark a field with field(metadata={"index": True}) to let a FieldIndex find files by it without reading them all.
     """
-    pass
\ No newline at end of file
+
+    @classmethod
+    def indexed_fields(cls) -> List[str]:
+        """Names of the fields marked with metadata={"index": True}, in the order they are declared."""
+        return [f.name for f in fields(cls) if f.metadata.get("index")]
\ No newline at end of file
@@ -4,13 +4,20 @@ from pathlib import Path
 import os
 import shutil
 import platform
-from typing import final
+from typing import Iterable, Iterator, final
 
 from CoreFunction.FileFormatABC import FileFormat
 
 
 class FileInterpreter(ABC):
-    """Assume the files exist"""
+    """
+    Assume the files exist
+    Text interpreters (the default) take and give str. Set binary = True to take and give bytes instead:
+    then nothing is ever decoded or encoded on the way between the disk (or remote) and read/write.
+    A binary read can also be given a memoryview (FileManager's mmap_threshold), so only use the buffer protocol on it.
+    """
+    binary: bool = False
+
     @property
     @abstractmethod
     def extension(self) -> str:
@@ -18,14 +25,28 @@ class FileInterpreter(ABC):
         pass
 
     @abstractmethod
-    def write(self, formatted: FileFormat) -> str:
-        """Takes a FileFormat, and returns a string to write to a file."""
+    def write(self, formatted: FileFormat) -> str | bytes:
+        """Takes a FileFormat, and returns a string (bytes if binary) to write to a file."""
         pass
 
     @abstractmethod
-    def read(self, file_contents: str) -> FileFormat:
+    def read(self, file_contents: str | bytes | memoryview) -> FileFormat:
         """
         Needs to take in the contents because there is always the chance that it only exists in the Google Drive
         Returns a FileFormat object to be messed with outside FileManager
         """
-        pass
\ No newline at end of file
+        pass
+
+    def write_chunks(self, formatted: FileFormat) -> Iterator[str | bytes]:
+        """
+        Optional. Same as write, but gives the text in pieces, so a huge file never has to be in memory all at once.
+        Used by FileManager when it is given a stream_chunk_size. By default, it's just write in one piece.
+        """
+        yield self.write(formatted)
+
+    def read_chunks(self, file_chunks: Iterable[str | bytes]) -> FileFormat:
+        """
+        Optional. Same as read, but takes the text in pieces (read it as it comes in, if your format can).
+        Used by FileManager when it is given a stream_chunk_size. By default, the pieces are joined and given to read.
+        """
+        return self.read((b"" if self.binary else "").join(file_chunks))
\ No newline at end of file
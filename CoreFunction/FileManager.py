@@ -1,11 +1,29 @@
 import asyncio
+import copy
+import hashlib
+from collections import deque
+import mmap
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum, auto
 from pathlib import Path
-from typing import List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Mapping, Tuple
 
 from CoreFunction.RemoteManagerABC import RemoteManager
+from CoreFunction.Compression import CompressedInterpreter, Compression
+from CoreFunction.FieldIndex import FieldIndex
 from CoreFunction.FileFormatABC import FileFormat
 from CoreFunction.FileInterpreterABC import FileInterpreter
+from CoreFunction.Instrumentation import NO_INSTRUMENTATION, Instrumentation, count_bytes, instrumented, instrumented_iterator, staged
+from CoreFunction.JsonJournal import JsonJournal
+from CoreFunction.KeyLocks import KeyLocks, SingleFlight
+from CoreFunction.ParsedCache import ParsedCache
+from CoreFunction.RemoteMetadataCache import RemoteMetadataCache
+from CoreFunction.RequestScheduler import bulk, bulk_requests
+from CoreFunction.SegmentStore import SegmentStore
+from CoreFunction.Sharding import check_layout, read_layout, scan_files, shard_name, write_layout
+from CoreFunction.SyncEngine import SyncEngine, SyncReport
+from CoreFunction.WriteBehindQueue import WriteBehindQueue
 
 
 class SaveMode(Enum):
@@ -14,6 +32,20 @@ class SaveMode(Enum):
     remote_and_local = auto()
 
 
+class CodecPolicy(Enum):
+    """Where FileInterpreter.read and write run."""
+    inline = auto() # On the event loop. Fastest for small files, but big ones block every other coroutine.
+    thread = auto() # On a thread pool. Frees the loop, but pure-python parsing still holds the GIL.
+    process = auto() # On a process pool, for CPU-heavy interpreters. The interpreter and FileFormats have to be picklable.
+    auto = auto() # Inline for small files, a thread for ones past codec_threshold (and always with compression).
+
+
+class LocalBackend(Enum):
+    """How local_only keeps files in base_dir."""
+    files = auto() # One real file per file. Easy to look at, but every small file costs an inode and a few system calls.
+    segments = auto() # Packed into a few big append-only files (see SegmentStore). Much cheaper for many small files.
+
+
 class FileManager:
     """
     Use: Make a FileInterpreter and a FileFormat that match your scenario. Need be, give it a RemoteManager (Not your own)
@@ -21,14 +53,78 @@ class FileManager:
     1. if a file does not exist when reading, raise an error.
     2. if a file exists in a remote drive and not Locally (or vice versa), raise an error. (Only if both are being used)
     3. if the mode is remote_only, all passed files are strings
+    Bookkeeping (like the hash manifest) is kept in base_dir/.filemanager, which is a directory so it never shows up as a file.
     """
-    def __init__(self, interpreter: FileInterpreter, base_dir: str | Path | None = None, remote_manager: RemoteManager | None = None) -> None:
+    META_DIR_NAME = ".filemanager"
+    # Past this many files, one remote listing is cheaper than asking the remote about each file
+    BULK_LISTING_THRESHOLD = 32
+    LOCAL_PAGE_SIZE = 1000 # How many local names iter_file_contents lists per thread hop
+    SANITIZED_CACHE_SIZE = 65536 # Sanitized names kept
+    def __init__(self, interpreter: FileInterpreter, base_dir: str | Path | None = None, remote_manager: RemoteManager | None = None,
+                 concurrency: int = 16, metadata_cache: RemoteMetadataCache | None = None,
+                 parsed_cache: ParsedCache | None = None, stream_chunk_size: int | None = None,
+                 write_behind: bool = False, mmap_threshold: int | None = None,
+                 codec_policy: CodecPolicy = CodecPolicy.auto, codec_threshold: int = 64 * 1024,
+                 field_index: FieldIndex | None = None, instrumentation: Instrumentation | None = None,
+                 shard_depth: int = 0, shard_width: int = 2, local_backend: LocalBackend = LocalBackend.files,
+                 compression: Compression | None = None, compression_level: int | None = None) -> None:
         """
         :param interpreter: A FileInterpreter instance for reading and writing for specific scenarios
         :param remote_manager: An optional instance of RemoteManager, just to upload copies to one's remote drive
         :param remote_only: An option to read/write to only a remote drive, or instead go off of nearby files, and backup to a remote drive.
+        :param concurrency: How many files bulk operations (like list_file_contents) work on at once. 1 means one after another.
+        :param metadata_cache: An optional RemoteMetadataCache, so existence checks on the remote are answered from memory.
+        :param parsed_cache: An optional ParsedCache, so reading an unchanged file doesn't read or parse it again.
+        :param stream_chunk_size: If given, read and write go piece by piece (this many characters at a time) through
+            FileInterpreter.read_chunks/write_chunks and RemoteManager.read_chunks/write_chunks, for files too big to hold whole.
+            The batch (*_many) methods don't stream, they are meant for many small files.
+        :param write_behind: remote_and_local only. Writes, creates and deletes return once the local file is done, and the
+            remote catches up in the background (see WriteBehindQueue). Call flush() to wait for it, and aclose() when done.
+            Until a file has been sent, the local copy is trusted as the real one. Uploads a crash left unsent start again
+            with the first operation.
+        :param mmap_threshold: Only for binary interpreters. Local files at least this many bytes are mmapped and given to
+            interpreter.read as a memoryview, instead of being copied into memory first.
+        :param codec_policy: Where interpreter.read/write run (see CodecPolicy). Streamed and mmapped reads always use a thread.
+        :param codec_threshold: For CodecPolicy.auto, how big (in characters or bytes) a file has to be to go to a thread.
+            Writes don't know the size until they're done, so they go by the average size of past writes.
+        :param field_index: An optional FieldIndex, so find/query can look files up by field instead of reading all of them.
+        :param instrumentation: Where to report timings, bytes and remote calls of every public call (see Instrumentation).
+            Also given to the remote_manager. None reports nothing, and costs next to nothing.
+        :param shard_depth: For huge stores. Puts every file shard_depth folders deep (locally and on the remote), in folders
+            named by a hash of its name, so no one folder gets too big. 0 keeps everything flat in base_dir.
+            Use Sharding.reshard to move an existing store to a new layout first, a base_dir laid out differently is refused.
+        :param shard_width: How many hex digits name each folder: 16 ** shard_width folders per level.
+        :param local_backend: local_only only. LocalBackend.segments packs every file into base_dir/.filemanager/segments
+            instead of keeping them as files, and compacts it in the background. Files kept one way aren't seen the other way,
+            so a base_dir that already has the other kind is refused.
+        :param compression: Compresses everything the interpreter writes (see CompressedInterpreter), locally and on the remote.
+            Files that aren't compressed (or use another codec) still read, so it can be turned on for an existing store.
+            It happens inside interpreter.read/write, so it runs wherever codec_policy says, except that auto always moves it
+            off the event loop (a small compressed file can inflate into a big one).
+        :param compression_level: 0 (fastest) to 9 (smallest), None for the codec's default.
         """
+        if concurrency < 1:
+            raise ValueError("concurrency has to be at least 1.")
+        if compression is not None:
+            interpreter = CompressedInterpreter(interpreter, compression, compression_level)
+        elif compression_level is not None:
+            raise ValueError("compression_level needs a compression.")
         self.interpreter = interpreter
+        self.concurrency = concurrency
+        self.instrumentation = instrumentation if instrumentation is not None else NO_INSTRUMENTATION
+        if instrumentation is not None and remote_manager is not None:
+            remote_manager.instrumentation = instrumentation
+        self.metadata_cache = metadata_cache
+        self.parsed_cache = parsed_cache
+        self.stream_chunk_size = stream_chunk_size
+        self.mmap_threshold = mmap_threshold
+        self.codec_policy = codec_policy
+        self.codec_threshold = codec_threshold
+        self._codec_executor: Executor | None = None
+        self._average_write_size: float = 0.0
+        # Writes, creates and deletes of one file go one at a time, and reads of one file at the same time share one read
+        self._key_locks = KeyLocks()
+        self._reads = SingleFlight()
         self.remote_manager: RemoteManager | None = None
         self.base_dir: Path | None = None
         self.save_mode: SaveMode = None
@@ -64,11 +160,221 @@ class FileManager:
             '?': '_q_',
             '*': '_star_'
         }
-        if remote and not self.base_dir.is_dir():
+        # One pass over the name instead of a replace per character. None of the replacements hold a bad character,
+        # so it comes out the same as replacing them one after another.
+        self._sanitize_table = str.maketrans(self.replacements)
+        self._sanitized: Dict[str, str] = {} # Names already sanitized, most programs use the same ones over and over
+        if remote and local and not self.base_dir.is_dir(): # remote_only has no base_dir to check
             raise TypeError("The base directory given is not a valid directory")
 
+        check_layout(shard_depth, shard_width)
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+        if local:
+            self._check_local_layout()
+        if remote: # Only once the layout is known to be right, reshard goes by what the remote_manager has
+            remote_manager.shard_depth, remote_manager.shard_width = shard_depth, shard_width
+
+        self.local_backend = local_backend
+        self.segments: SegmentStore | None = None
+        self._compaction: asyncio.Task | None = None
+        self._check_local_backend() # Also without a base_dir, which can't have segments
+        if local_backend == LocalBackend.segments:
+            self.segments = SegmentStore(self.meta_dir / "segments")
+
+        # Last known (local hash, remote hash) of every file that matched, so reads don't have to download to compare.
+        self.manifest: JsonJournal | None = None
+        if self.save_mode == SaveMode.remote_and_local:
+            self.manifest = JsonJournal(self.meta_dir / "manifest.jsonl")
+
+        self._sync_engine: SyncEngine | None = None
+        self.write_behind: WriteBehindQueue | None = None
+        if write_behind:
+            if self.save_mode != SaveMode.remote_and_local:
+                raise TypeError("write_behind only works with both a base_dir and a remote_manager.")
+            self.write_behind = WriteBehindQueue(self.meta_dir / "write_behind.jsonl", self._replicate, concurrency=self.concurrency)
+
+        self.field_index = field_index
+        if field_index is not None and field_index.journal is None and self.meta_dir is not None:
+            field_index.open(self.meta_dir / "index.jsonl")
+
+    def _check_local_layout(self) -> None:
+        """Makes sure base_dir is laid out the way shard_depth/shard_width say, saving the layout the first time."""
+        saved = read_layout(self.meta_dir)
+        if saved is None:
+            if not self.shard_depth:
+                return # Flat, same as a base_dir from before sharding existed
+            has_files = any(entry.is_file() for entry in os.scandir(self.base_dir)) if self.base_dir.is_dir() else False
+            if has_files:
+                raise ValueError(f"{self.base_dir} has files laid out flat. Move them with Sharding.reshard first.")
+            write_layout(self.meta_dir, self.shard_depth, self.shard_width)
+            return
+        if (saved[0], saved[1] if saved[0] else None) != (self.shard_depth, self.shard_width if self.shard_depth else None):
+            raise ValueError(f"{self.base_dir} is sharded with shard_depth={saved[0]}, shard_width={saved[1]}. "
+                             f"Use those, or move it with Sharding.reshard first.")
+
+    def _check_local_backend(self) -> None:
+        """Makes sure local_backend fits the save mode, and base_dir doesn't hold files it can't see."""
+        if self.local_backend == LocalBackend.segments:
+            if self.save_mode != SaveMode.local_only:
+                raise TypeError("local_backend=LocalBackend.segments only works with just a base_dir.")
+            if self.shard_depth:
+                raise ValueError("Segments don't need (and can't use) shard_depth, there are only a few of them.")
+            if self.base_dir.is_dir() and any(entry.is_file() for entry in os.scandir(self.base_dir)):
+                raise ValueError(f"{self.base_dir} already has files kept one per file. Use local_backend=LocalBackend.files.")
+        elif self.meta_dir is not None and any((self.meta_dir / "segments").glob("segment-*.dat")):
+            raise ValueError(f"{self.base_dir} keeps its files in segments. Use local_backend=LocalBackend.segments.")
+
+    def _maybe_compact(self) -> None:
+        """Starts compacting the segments in the background, if they need it and it isn't already going."""
+        if self.segments is None or (self._compaction is not None and not self._compaction.done()):
+            return
+        if self.segments.needs_compaction():
+            self._compaction = asyncio.get_running_loop().create_task(asyncio.to_thread(self.segments.compact))
+
+    @property
+    def meta_dir(self) -> Path | None:
+        """Where FileManager keeps its own bookkeeping files. None in remote_only."""
+        if self.base_dir is None:
+            return None
+        return self.base_dir / self.META_DIR_NAME
+
+    def _pending_remote(self, file_name: str) -> str | None:
+        """
+        What write_behind still has to do to this file on the remote ("write" or "delete"), or None.
+        Every operation with write_behind comes through here, so it's also where uploads left in the journal get started.
+        """
+        if self.write_behind is None:
+            return None
+        self.write_behind.resume()
+        return self.write_behind.pending_op(file_name)
+
+    @bulk
+    async def _replicate(self, file_name: str, op: str) -> None:
+        """Makes the remote copy match the local one right now. Used by the write_behind queue."""
+        path = self._to_path(file_name)
+        if op == "write":
+            # Under the file's lock, so it isn't read halfway through a write or deleted while being read.
+            # Streamed uploads read it all the way up, so they keep it until they're done, the rest only while reading it.
+            async with self._key_locks.hold(file_name):
+                if self.stream_chunk_size is not None:
+                    if path.exists():
+                        await self._upload(file_name, path, None)
+                        return
+                    contents = None
+                else:
+                    try:
+                        contents = await asyncio.to_thread(self._read_local, path)
+                    except FileNotFoundError:
+                        contents = None
+            if contents is not None:
+                await self._upload(file_name, path, contents)
+                return
+            # Else it was deleted locally since it was queued, so it's a delete after all
+
+        if await self._remote_exists(file_name):
+            await self.remote_manager.delete(file_name)
+        self._remote_changed(file_name, False)
+        self.manifest.delete(file_name)
+
+    async def _upload(self, file_name: str, path: Path, contents: str | bytes | None) -> None:
+        """The write half of _replicate. contents None streams the local file up instead."""
+        if not await self._remote_exists(file_name):
+            await self.remote_manager.create(file_name)
+            self._remote_changed(file_name, True)
+
+        if contents is None:
+            digest = hashlib.sha256()
+
+            def digested(chunks: Iterable[str]) -> Iterator[str]:
+                for chunk in chunks:
+                    digest.update(self._as_bytes(chunk))
+                    yield chunk
+
+            remote_hash = await self.remote_manager.write_chunks(file_name, digested(self._iter_local(path)), self.interpreter.binary)
+            local_digest = digest.hexdigest()
+        else:
+            remote_hash = await self._remote_write(file_name, contents)
+            local_digest = self._digest(contents)
+        self._remember_hashes(file_name, local_digest, remote_hash)
+
+    @instrumented
+    async def flush(self, timeout: float | None = None) -> None:
+        """With write_behind, waits until the remote has caught up (including anything left over from a crash). Else does nothing."""
+        if self.write_behind is not None:
+            await self.write_behind.flush(timeout)
+
+    @instrumented
+    async def aclose(self, timeout: float | None = None) -> None:
+        """
+        With write_behind, flushes and stops the background uploads. Also shuts down the codec thread/process pool,
+        and with segments, waits for compaction and saves their index so the next open is quick.
+        Call it before throwing the FileManager away.
+        """
+        if self.write_behind is not None:
+            await self.write_behind.aclose(timeout)
+        if self.segments is not None:
+            if self._compaction is not None:
+                await self._compaction
+            await asyncio.to_thread(self.segments.close)
+        if self._codec_executor is not None:
+            self._codec_executor.shutdown(wait=False)
+            self._codec_executor = None
+
+    @instrumented
+    @bulk
+    async def sync(self, conflict: str = "report", concurrency: int | None = None) -> SyncReport:
+        """
+        remote_and_local only. Makes base_dir and the remote the same, moving only files that were added, changed or deleted
+        (on either side) since the last sync, `concurrency` at a time. Unlike _list_files, differences get fixed, not raised.
+        :param conflict: For files changed on both sides: "report" (leave them, and list them in the report), "local" or "remote" (that side wins).
+        Failed files are in the report too, and get tried again next time.
+        """
+        if self.save_mode != SaveMode.remote_and_local:
+            raise TypeError("sync only works with both a base_dir and a remote_manager.")
+        if self._sync_engine is None:
+            self._sync_engine = SyncEngine(self)
+        return await self._sync_engine.sync(conflict, concurrency)
+
+    def _codec_pool(self) -> Executor:
+        """The pool for CodecPolicy.thread/process (and big files in auto). Made on first use."""
+        if self._codec_executor is None:
+            if self.codec_policy == CodecPolicy.process:
+                self._codec_executor = ProcessPoolExecutor()
+            else:
+                self._codec_executor = ThreadPoolExecutor(thread_name_prefix="FileManagerCodec")
+        return self._codec_executor
 
+    def _off_loop(self, size: float) -> bool:
+        match self.codec_policy:
+            case CodecPolicy.inline:
+                return False
+            case CodecPolicy.auto:
+                # Compressed sizes say nothing about how long inflating and parsing takes, so those always go
+                return size >= self.codec_threshold or isinstance(self.interpreter, CompressedInterpreter)
+            case _:
+                return True
+
+    @staged("decode")
+    async def _decode(self, contents: str | bytes) -> FileFormat:
+        """interpreter.read, run wherever codec_policy says."""
+        if not self._off_loop(len(contents)):
+            return self.interpreter.read(contents)
+        return await asyncio.get_running_loop().run_in_executor(self._codec_pool(), self.interpreter.read, contents)
+
+    @staged("encode")
+    async def _encode(self, formatted: FileFormat) -> str | bytes:
+        """interpreter.write, run wherever codec_policy says."""
+        if not self._off_loop(self._average_write_size):
+            contents = self.interpreter.write(formatted)
+        else:
+            contents = await asyncio.get_running_loop().run_in_executor(self._codec_pool(), self.interpreter.write, formatted)
+        self._average_write_size += (len(contents) - self._average_write_size) * 0.1
+        return contents
 
+
+
+    @staged("sanitize")
     def _sanitize_file_name(self, file_name: str | Path) -> str:
         """
         WOO this is a pain. Call this before running most functions. This sanitized file names by...
@@ -78,6 +384,11 @@ class FileManager:
         Takes the result, slaps on the extension, and it *should* be the same file.
         (This is private because all sanitization is done inside this class. They should not NEED to use this.)
         """
+        if isinstance(file_name, str):
+            sanitized = self._sanitized.get(file_name)
+            if sanitized is not None:
+                return sanitized
+
         required_ext = self.interpreter.extension
 
         if isinstance(file_name, str):
@@ -91,12 +402,16 @@ class FileManager:
             raise TypeError(f"File {file_name} must be a string or a Path.")
 
         # Sanitize illegal characters
-        for bad_c, replace_c in self.replacements.items():
-            stem = stem.replace(bad_c, replace_c)
+        stem = stem.translate(self._sanitize_table)
 
         stem = stem.rstrip(". ") # Windows gets mad
 
-        return stem + required_ext
+        sanitized = stem + required_ext
+        if isinstance(file_name, str):
+            if len(self._sanitized) >= self.SANITIZED_CACHE_SIZE:
+                self._sanitized.clear() # Cheaper than keeping track of which are used, and it refills with the ones that are
+            self._sanitized[file_name] = sanitized
+        return sanitized
 
 
     def _to_path(self, file: str | Path) -> Path:
@@ -105,7 +420,8 @@ class FileManager:
             raise TypeError("Some file tried to become a path in remote_only")
 
         if isinstance(file, str):
-            file = (self.base_dir / file).resolve()
+            # No resolve(): base_dir already is, and sanitized names have no separators or "..", so it would only cost syscalls
+            file = self.base_dir / (shard_name(file, self.shard_depth, self.shard_width) if self.shard_depth else file)
 
         if not isinstance(file, Path):
             raise TypeError("File needs to be either a string or a Path.")
@@ -113,23 +429,248 @@ class FileManager:
         return file
 
 
-    async def _check_contents(self, file: str | Path, give_error = True) -> bool:
+    # Everything below moves str for text interpreters and bytes for binary ones, so binary files are never transcoded.
+
+    @staticmethod
+    def _as_bytes(contents: str | bytes | memoryview) -> bytes | memoryview:
+        return contents.encode() if isinstance(contents, str) else contents
+
+    @classmethod
+    def _digest(cls, contents: str | bytes | memoryview) -> str:
+        return hashlib.sha256(cls._as_bytes(contents)).hexdigest()
+
+    @classmethod
+    def _digest_chunks(cls, chunks: Iterable[str | bytes]) -> str:
+        """Same as _digest of the joined chunks, without joining them."""
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(cls._as_bytes(chunk))
+        return digest.hexdigest()
+
+    def _touch_local(self, path: Path) -> None:
+        """Makes an empty local file, and its shard folders if it has any. Blocking, use it from a thread."""
+        if self.segments is not None:
+            self.segments.put(path.name, b"")
+            return
+        if self.shard_depth:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+    def _read_local(self, path: Path) -> str | bytes:
+        """Blocking, use it from a thread."""
+        if self.segments is not None:
+            contents = self.segments.get(path.name)
+            if not self.interpreter.binary:
+                contents = contents.decode()
+        else:
+            contents = path.read_bytes() if self.interpreter.binary else path.read_text()
+        count_bytes(self.instrumentation, "local_read", len(contents))
+        return contents
+
+    def _write_local(self, path: Path, contents: str | bytes) -> None:
+        """Blocking, use it from a thread."""
+        if self.segments is not None:
+            self.segments.put(path.name, self._as_bytes(contents))
+        elif self.interpreter.binary:
+            path.write_bytes(contents)
+        else:
+            path.write_text(contents)
+        count_bytes(self.instrumentation, "local_write", len(contents))
+
+    async def _remote_read(self, file_name: str) -> str | bytes:
+        contents = await (self.remote_manager.read_bytes(file_name) if self.interpreter.binary else self.remote_manager.read(file_name))
+        count_bytes(self.instrumentation, "remote_read", len(contents))
+        return contents
+
+    async def _remote_write(self, file_name: str, contents: str | bytes) -> str | None:
+        count_bytes(self.instrumentation, "remote_write", len(contents))
+        if self.interpreter.binary:
+            return await self.remote_manager.write_bytes(file_name, contents)
+        return await self.remote_manager.write(file_name, contents)
+
+    def _iter_local(self, path: Path) -> Iterator[str | bytes]:
+        """Reads a local file stream_chunk_size characters (bytes if binary) at a time. Blocking, use it from a thread."""
+        if self.segments is not None: # Records are small, the whole thing is already in the mmap anyway
+            contents = self._read_local(path)
+            for start in range(0, len(contents), self.stream_chunk_size):
+                yield contents[start:start + self.stream_chunk_size]
+            return
+        with path.open("rb" if self.interpreter.binary else "r") as file:
+            while chunk := file.read(self.stream_chunk_size):
+                count_bytes(self.instrumentation, "local_read", len(chunk))
+                yield chunk
+
+    def _write_local_chunks(self, path: Path, chunks: Iterable[str | bytes]) -> str:
+        """Writes the chunks to a local file, and gives back their digest. Blocking, use it from a thread."""
+        digest = hashlib.sha256()
+        if self.segments is not None: # A record is written in one go
+            contents = b"".join(self._as_bytes(chunk) for chunk in chunks)
+            digest.update(contents)
+            self.segments.put(path.name, contents)
+            count_bytes(self.instrumentation, "local_write", len(contents))
+            return digest.hexdigest()
+        with path.open("wb" if self.interpreter.binary else "w") as file:
+            for chunk in chunks:
+                digest.update(self._as_bytes(chunk))
+                file.write(chunk)
+                count_bytes(self.instrumentation, "local_write", len(chunk))
+        return digest.hexdigest()
+
+    def _with_local_mmap(self, path: Path, func: Callable[[memoryview], Any]) -> Tuple[Any, int] | None:
+        """
+        Gives func a memoryview of a big local file straight out of an mmap (no copy), and returns (what it gave, file size).
+        Gives None if the file isn't big enough to bother, or mmap_threshold isn't set, or the interpreter isn't binary.
+        Blocking, use it from a thread.
+        """
+        if self.mmap_threshold is None or not self.interpreter.binary or self.segments is not None:
+            return None
+        with path.open("rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0 or size < self.mmap_threshold: # Empty files can't be mmapped anyway
+                return None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    return func(view), size
+                finally:
+                    view.release() # The mmap can't close while a view is still out
+
+    def _local_exists(self, path: Path) -> bool:
+        return self.segments.exists(path.name) if self.segments is not None else path.exists()
+
+    def _create_local(self, path: Path) -> bool:
+        """
+        Makes an empty local file (and its shard folders) only if it isn't there yet, checking and making it in one step
+        (O_CREAT | O_EXCL). Gives back False if it was already there. Blocking, use it from a thread.
+        """
+        if self.segments is not None: # The file's lock is held, nothing else can put it in between
+            if self.segments.exists(path.name):
+                return False
+            self.segments.put(path.name, b"")
+            return True
+        if self.shard_depth:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            return False
+        return True
+
+    def _put_local(self, path: Path, contents: str | bytes, stamp: bool) -> List[int] | None:
+        """
+        _write_local that also makes the file's shard folders if they aren't there, and gives back its _local_stamp
+        if stamp is True (for the field index), so a whole local write is one thread hop. Blocking, use it from a thread.
+        """
+        try:
+            self._write_local(path, contents)
+        except FileNotFoundError:
+            if not self.shard_depth:
+                raise
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._write_local(path, contents)
+        return self._local_stamp(path) if stamp else None
+
+    def _unlink_local(self, path: Path) -> None:
+        """Raises FileNotFoundError if it's not there. Blocking, use it from a thread."""
+        if self.segments is not None:
+            self.segments.delete(path.name)
+        else:
+            path.unlink(missing_ok=False)
+
+    def _local_stamp(self, path: Path) -> List[int] | None:
+        """
+        Something cheap that changes whenever the local file is written: mtime and size,
+        or where the record is and its size for segments. None if it's not there. Blocking.
+        """
+        if self.segments is not None:
+            stamp = self.segments.stamp(path.name)
+            return None if stamp is None else [*stamp, self.segments.size(path.name)]
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _remember_hashes(self, file_name: str, local_digest: str, remote_hash: str | None) -> None:
+        """Saves that these contents match on both sides. Without a remote hash there is nothing to trust later, so forget it."""
+        if remote_hash is None:
+            self.manifest.delete(file_name)
+        else:
+            self.manifest.set(file_name, {"local": local_digest, "remote": remote_hash})
+
+    @staged("check_contents")
+    async def _check_contents(self, file: str | Path, give_error = True, local_contents: str | None = None) -> bool:
+        """
+        Makes sure the local and remote copies match.
+        If the remote gives content hashes, and both hashes are the same as the last time they matched, nothing is downloaded.
+        Otherwise (or with no hash support), falls back to downloading and comparing the whole file.
+        :param local_contents: Pass the local contents if they were already read, so they aren't read twice.
+        """
         if self.save_mode is not SaveMode.remote_and_local: # Unrelated to give_error because this is a big issue
             raise FileNotFoundError("Tried to match the file contents of local and a remote drive, but one does not exist")
 
         file: Path = self._to_path(file)
+        if self._pending_remote(file.name) is not None:
+            return True # The remote hasn't caught up yet, the local copy is the real one
+        streaming = self.stream_chunk_size is not None and local_contents is None
 
-        remote_contents = await self.remote_manager.read(file.name)
-        local_contents = await asyncio.to_thread(file.read_text)
+        mapped = None
+        if streaming:
+            local_digest = await asyncio.to_thread(lambda: self._digest_chunks(self._iter_local(file)))
+        else:
+            if local_contents is None:
+                mapped = await asyncio.to_thread(self._with_local_mmap, file, self._digest)
+                if mapped is None:
+                    local_contents = await asyncio.to_thread(self._read_local, file)
+            local_digest = mapped[0] if mapped is not None else self._digest(local_contents)
+
+        remote_hash = await self.remote_manager.content_hash(file.name)
+        if remote_hash is not None:
+            known = self.manifest.get(file.name)
+            if known is not None and known["remote"] == remote_hash and known["local"] == local_digest:
+                return True
+
+        if streaming: # Compare digests, so neither file has to be held whole
+            matches = local_digest == await self.remote_manager.read_chunks(file.name, self._digest_chunks, self.interpreter.binary)
+        elif mapped is not None:
+            matches = local_digest == self._digest(await self._remote_read(file.name))
+        else:
+            matches = local_contents == await self._remote_read(file.name)
 
-        if local_contents != remote_contents:
+        if not matches:
+            self.manifest.delete(file.name)
             if give_error:
                 raise Exception(f"File mismatch: {file} differs between local and remote copies.")
             else:
                 return False
+        self._remember_hashes(file.name, local_digest, remote_hash)
         return True
 
 
+    async def _remote_exists(self, file_name: str) -> bool:
+        """Asks the metadata cache first (if there is one), and only goes to the remote when it doesn't know."""
+        if self.metadata_cache is not None:
+            exists = self.metadata_cache.get(file_name)
+            if exists is not None:
+                return exists
+
+        exists = await self.remote_manager.exists(file_name)
+        if self.metadata_cache is not None:
+            self.metadata_cache.set(file_name, exists)
+        return exists
+
+    def _remote_changed(self, file_name: str, exists: bool) -> None:
+        """Call after creating, writing or deleting on the remote to keep the metadata cache right."""
+        if self.metadata_cache is not None:
+            self.metadata_cache.set(file_name, exists)
+
+    async def _remote_list_files(self) -> List[str]:
+        files = await self.remote_manager.list_files()
+        if self.metadata_cache is not None:
+            self.metadata_cache.fill(files)
+        return files
+
+    @staged("exist")
     async def _exist(self, file: str | Path, give_error = True, sanitize = True) -> bool:
         """Gives an error for non-existing files unless give_error is False. Returns a boolean if the files exist"""
         if sanitize:
@@ -139,16 +680,19 @@ class FileManager:
 
         match self.save_mode:
             case SaveMode.remote_only:
-                if not await self.remote_manager.exists(file):
+                if not await self._remote_exists(file):
                     exist = False
 
             case SaveMode.local_only:
                 file: Path = self._to_path(file)
-                exist = file.exists()
+                exist = self._local_exists(file)
 
             case SaveMode.remote_and_local:
                 file: Path = self._to_path(file)
-                exist = file.exists() and await self.remote_manager.exists(file.name)
+                if self._pending_remote(file.name) is not None:
+                    exist = file.exists()
+                else:
+                    exist = file.exists() and await self._remote_exists(file.name)
 
             case _:
                 # Only need to call the _ case once, the other functions call this ASAP
@@ -158,6 +702,7 @@ class FileManager:
             raise FileNotFoundError(f"File {file} does not exist")
         return exist
 
+    @instrumented
     async def exist(self, file: str | Path, give_error = True) -> bool:
         """Gives an error for non-existing files unless give_error is False. Returns a boolean if the files exist"""
         return await self._exist(file, give_error=give_error, sanitize=True) # True, because we are scared of what the user gives
@@ -168,22 +713,36 @@ class FileManager:
         if sanitize:
             file_name: str = self._sanitize_file_name(file_name)
 
-        if await self._exist(file_name, give_error=False, sanitize=False): # We already sanitized
-            raise Exception(f"Tried to create a file ({file_name}) that already exists.")
-
+        async with self._key_locks.hold(file_name):
+            if self.save_mode == SaveMode.local_only: # Checked and made in one go, no stat first
+                created = await asyncio.to_thread(self._create_local, self._to_path(file_name))
+            else:
+                created = not await self._exist(file_name, give_error=False, sanitize=False) # We already sanitized
+                if created:
+                    await self._create_raw(file_name)
+            if not created:
+                raise Exception(f"Tried to create a file ({file_name}) that already exists.")
+
+    async def _create_raw(self, file_name: str) -> None:
+        """Trusting that the file name is sanitized, and that the file doesn't exist yet."""
         match self.save_mode:
             case SaveMode.remote_only:
                 await self.remote_manager.create(file_name)
+                self._remote_changed(file_name, True)
 
             case SaveMode.local_only:
-                path: Path = self.base_dir / file_name
-                await asyncio.to_thread(path.touch)
+                await asyncio.to_thread(self._touch_local, self._to_path(file_name))
 
             case SaveMode.remote_and_local:
-                await self.remote_manager.create(file_name)
-                path: Path = self.base_dir / file_name
-                await asyncio.to_thread(path.touch)
-
+                if self.write_behind is None:
+                    await self.remote_manager.create(file_name)
+                    self._remote_changed(file_name, True)
+                await asyncio.to_thread(self._touch_local, self._to_path(file_name))
+                self.manifest.delete(file_name)
+                if self.write_behind is not None:
+                    self.write_behind.enqueue(file_name, "write")
+
+    @instrumented
     async def create(self, file_name: str) -> None: # Does not accept a Path because you should not have a path that doesn't exist
         """Creates a file, makes sure it doesn't exist."""
         await self._create(file_name, sanitize=True) # True, because we are scared of what the user gives
@@ -192,23 +751,42 @@ class FileManager:
     async def _delete(self, file: str | Path, check_exists=True, sanitize=True) -> None:
         if sanitize:
             file: str = self._sanitize_file_name(file)
-        if check_exists:
+        async with self._key_locks.hold(Path(file).name):
+            await self._delete_locked(file, check_exists)
+
+    async def _delete_locked(self, file: str | Path, check_exists: bool) -> None:
+        self._forget_parsed(file)
+        if check_exists and self.save_mode != SaveMode.local_only: # local_only finds out from the unlink itself
             await self._exist(file, give_error=True, sanitize=False)
 
         match self.save_mode:
             case SaveMode.remote_only:
                 await self.remote_manager.delete(file)
+                self._remote_changed(file, False)
+                self._unindex_file(file)
 
             case SaveMode.local_only:
                 file: Path = self._to_path(file)
-                await asyncio.to_thread(file.unlink, missing_ok=False)
+                try:
+                    await asyncio.to_thread(self._unlink_local, file)
+                except FileNotFoundError:
+                    raise FileNotFoundError(f"File {file} does not exist") from None
+                self._unindex_file(file)
+                self._maybe_compact()
 
             case SaveMode.remote_and_local:
                 file: Path = self._to_path(file)
-                await self.remote_manager.delete(file.name)
+                if self.write_behind is None:
+                    await self.remote_manager.delete(file.name)
+                    self._remote_changed(file.name, False)
                 await asyncio.to_thread(file.unlink, missing_ok=False)
+                self.manifest.delete(file.name)
+                self._unindex_file(file)
+                if self.write_behind is not None:
+                    self.write_behind.enqueue(file.name, "delete")
 
 
+    @instrumented
     async def delete(self, file: str | Path) -> None:
         await self._delete(file, check_exists=True, sanitize=True)
 
@@ -222,28 +800,128 @@ class FileManager:
 
         match self.save_mode:
             case SaveMode.remote_only:
-                contents = await self.remote_manager.read(file)
+                contents = await self._remote_read(file)
 
             case SaveMode.local_only:
-                contents = await asyncio.to_thread(self._to_path(file).read_text)
+                contents = await asyncio.to_thread(self._read_local, self._to_path(file))
 
             case SaveMode.remote_and_local:
-                await self._check_contents(file) # Checks if contents match
-                contents = self._to_path(file).read_text() # Doesn't matter if we use the remote drive either.
+                contents = await asyncio.to_thread(self._read_local, self._to_path(file)) # Doesn't matter if we use the remote drive either.
+                await self._check_contents(file, local_contents=contents) # Checks if contents match
         return contents
 
+    async def _fingerprint(self, file: str | Path) -> Hashable | None:
+        """
+        Something cheap that changes when the file changes, for the parsed cache. Local files use mtime and size,
+        the remote uses its content hash. None if there's no way to tell (a remote without hashes), so nothing is cached.
+        """
+        remote_hash = None
+        if self.save_mode != SaveMode.local_only:
+            remote_hash = await self.remote_manager.content_hash(Path(file).name)
+            if remote_hash is None:
+                return None
+        if self.save_mode == SaveMode.remote_only:
+            return remote_hash
+
+        stamp = await asyncio.to_thread(self._local_stamp, self._to_path(file))
+        if stamp is None:
+            return None
+        return *stamp, remote_hash
+
+    def _forget_parsed(self, file: str | Path) -> None:
+        if self.parsed_cache is not None:
+            self.parsed_cache.invalidate(Path(file).name)
+
     async def _read(self, file: str | Path, check_exists = True, sanitize = True) -> FileFormat:
-        """A more-specific version of self.read, we just don't want to check/sanitize unnecessarily"""
+        """
+        A more-specific version of self.read, we just don't want to check/sanitize unnecessarily
+        Reads of the same file at the same time share one read and parse (everyone but the first gets a copy),
+        and wait for any write, create or delete of it that's going on.
+        """
         if sanitize:
             file: str = self._sanitize_file_name(file)
 
-        if check_exists:
+        name = Path(file).name
+        if self._key_locks.held_here(name): # Already in the middle of changing this file, waiting on it would never end
+            return await self._read_locked(file, check_exists)
+
+        async def read_once() -> FileFormat:
+            async with self._key_locks.hold(name):
+                return await self._read_locked(file, check_exists)
+
+        formatted, shared = await self._reads.do((name, check_exists), read_once)
+        return copy.deepcopy(formatted) if shared else formatted
+
+    async def _read_locked(self, file: str | Path, check_exists: bool) -> FileFormat:
+        # local_only finds out from reading the file itself, saving a stat. Streamed reads only open it in the interpreter.
+        missing_raises = self.save_mode == SaveMode.local_only and self.stream_chunk_size is None
+        if check_exists and not missing_raises:
             await self._exist(file, sanitize=False) # We already sanitized
 
-        contents = await self._read_raw(file)
-        formatted: FileFormat = self.interpreter.read(contents)
+        fingerprint = None
+        if self.parsed_cache is not None:
+            # Taken before reading, so if the file changes in between, the newer contents are just saved under an old fingerprint
+            fingerprint = await self._fingerprint(file)
+            if fingerprint is not None:
+                cached = self.parsed_cache.get(Path(file).name, fingerprint)
+                if cached is not None:
+                    return cached
+
+        try:
+            formatted, size = await self._read_contents(file)
+        except FileNotFoundError:
+            if not missing_raises:
+                raise
+            raise FileNotFoundError(f"File {self._to_path(file)} does not exist") from None
+        if fingerprint is not None:
+            self.parsed_cache.put(Path(file).name, fingerprint, formatted, size)
         return formatted
 
+    async def _read_contents(self, file: str | Path) -> Tuple[FileFormat, int]:
+        """Reads and parses the file whichever way fits it. Gives back the FileFormat and its size."""
+        mapped = None
+        if self.stream_chunk_size is not None:
+            return await self._read_streamed(file)
+        if self.mmap_threshold is not None and self.interpreter.binary and self.save_mode != SaveMode.remote_only:
+            path = self._to_path(file)
+            if self.save_mode == SaveMode.remote_and_local and (await asyncio.to_thread(os.stat, path)).st_size >= self.mmap_threshold:
+                await self._check_contents(file)
+            mapped = await asyncio.to_thread(self._with_local_mmap, path, self.interpreter.read)
+
+        if mapped is not None:
+            return mapped
+        contents = await self._read_raw(file)
+        return await self._decode(contents), len(contents)
+
+    async def _read_streamed(self, file: str | Path) -> Tuple[FileFormat, int]:
+        """
+        Like _read_raw and interpreter.read together, but piece by piece, so the file is never held whole here.
+        Gives back the FileFormat and how many characters were read.
+        """
+        size = 0
+
+        def counted(chunks: Iterable[str]) -> Iterator[str]:
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+
+        match self.save_mode:
+            case SaveMode.remote_only:
+                formatted = await self.remote_manager.read_chunks(file, lambda chunks: self.interpreter.read_chunks(counted(chunks)),
+                                                                  self.interpreter.binary)
+
+            case SaveMode.local_only:
+                path = self._to_path(file)
+                formatted = await asyncio.to_thread(lambda: self.interpreter.read_chunks(counted(self._iter_local(path))))
+
+            case SaveMode.remote_and_local:
+                await self._check_contents(file)
+                path = self._to_path(file)
+                formatted = await asyncio.to_thread(lambda: self.interpreter.read_chunks(counted(self._iter_local(path))))
+        return formatted, size
+
+    @instrumented
     async def read(self, file: str | Path) -> FileFormat:
         return await self._read(file, check_exists=True, sanitize=True) # True, because we are scared of what the user gives
 
@@ -255,64 +933,553 @@ class FileManager:
         """
         match self.save_mode:
             case SaveMode.remote_only:
-                await self.remote_manager.write(file, file_contents)
+                await self._remote_write(file, file_contents)
+                self._remote_changed(file, True)
 
             case SaveMode.local_only:
                 file_path: Path = self._to_path(file)
-                await asyncio.to_thread(file_path.write_text, file_contents)
+                await asyncio.to_thread(self._write_local, file_path, file_contents)
 
             case SaveMode.remote_and_local:
                 file_path: Path = self._to_path(file)
-                await self.remote_manager.write(file, file_contents)
-                file_path.write_text(file_contents)
+                if self.write_behind is not None:
+                    await asyncio.to_thread(self._write_local, file_path, file_contents)
+                    self.write_behind.enqueue(file_path.name, "write")
+                    return
+                remote_hash = await self._remote_write(file_path.name, file_contents)
+                self._remote_changed(file_path.name, True)
+                await asyncio.to_thread(self._write_local, file_path, file_contents)
+                self._remember_hashes(file_path.name, self._digest(file_contents), remote_hash)
 
     async def _write(self, file: str | Path, formatted: FileFormat, create_if_none = False, sanitize = True) -> None:
         """Does not have a check_exists because that is what create_if_none inherently does."""
         if sanitize:
             file: str = self._sanitize_file_name(file)
+        async with self._key_locks.hold(Path(file).name): # So two create_if_none writes can't both try to create it
+            await self._write_locked(file, formatted, create_if_none)
 
+    async def _write_locked(self, file: str | Path, formatted: FileFormat, create_if_none: bool) -> None:
         # Do not sanitize, we already have
+        if self.save_mode == SaveMode.local_only and self.stream_chunk_size is None:
+            # Writing makes the file if it isn't there, so create_if_none needs no stat or touch of its own,
+            # and the index's stamp comes back from the same thread hop
+            self._forget_parsed(file)
+            contents = await self._encode(formatted)
+            path = self._to_path(file)
+            stamp = await asyncio.to_thread(self._put_local, path, contents, self.field_index is not None)
+            if self.field_index is not None:
+                self.field_index.update(path.name, formatted, stamp)
+            self._maybe_compact()
+            return
+
         if create_if_none and not await self._exist(file, give_error=False, sanitize=False):
             # Does not check if file is a Path because it was probably sanitized, and not-existing files shouldn't be Paths
             await self._create(file, sanitize=False)
 
-        contents = self.interpreter.write(formatted)
-        await self._write_raw(file, contents)
+        self._forget_parsed(file)
+        if self.stream_chunk_size is not None:
+            await self._write_streamed(file, formatted)
+        else:
+            contents = await self._encode(formatted)
+            await self._write_raw(file, contents)
+        await self._index_many([(file, formatted)])
+        self._maybe_compact()
+
+    async def _write_streamed(self, file: str | Path, formatted: FileFormat) -> None:
+        """Like interpreter.write and _write_raw together, but piece by piece, so the file is never held whole here."""
+        match self.save_mode:
+            case SaveMode.remote_only:
+                await self.remote_manager.write_chunks(file, self.interpreter.write_chunks(formatted), self.interpreter.binary)
+                self._remote_changed(file, True)
 
+            case SaveMode.local_only:
+                path: Path = self._to_path(file)
+                await asyncio.to_thread(self._write_local_chunks, path, self.interpreter.write_chunks(formatted))
+
+            case SaveMode.remote_and_local:
+                path: Path = self._to_path(file)
+                if self.write_behind is not None:
+                    await asyncio.to_thread(self._write_local_chunks, path, self.interpreter.write_chunks(formatted))
+                    self.write_behind.enqueue(path.name, "write")
+                    return
+                # The chunks can only be made once, so they go to a temp file, then get uploaded from there.
+                # Only once the upload works does the temp file replace the real one, same as the remote-first order of _write_raw.
+                temp = self.meta_dir / f"{path.name}.upload"
+                temp.parent.mkdir(exist_ok=True)
+                try:
+                    local_digest = await asyncio.to_thread(self._write_local_chunks, temp, self.interpreter.write_chunks(formatted))
+                    remote_hash = await self.remote_manager.write_chunks(path.name, self._iter_local(temp), self.interpreter.binary)
+                    self._remote_changed(path.name, True)
+                    await asyncio.to_thread(os.replace, temp, path)
+                finally:
+                    temp.unlink(missing_ok=True)
+                self._remember_hashes(path.name, local_digest, remote_hash)
+
+    @instrumented
     async def write(self, file: str | Path, formatted: FileFormat, create_if_none = False) -> None:
         await self._write(file, formatted, create_if_none, sanitize=True)
 
 
+    async def _gather_limited(self, items: Iterable[Any], func: Callable[[Any], Awaitable[Any]], concurrency: int | None = None) -> List[Any]:
+        """
+        Runs func on every item, at most `concurrency` at a time.
+        Results come back in the same order as items. A failing item gives back its exception instead of a result,
+        so one bad file doesn't stop (or hide) the rest.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def run(item: Any) -> Any:
+            async with semaphore:
+                try:
+                    return await func(item)
+                except Exception as e:
+                    e.add_note(f"While working on file \"{item}\"")
+                    return e
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    @staticmethod
+    def _raise_failures(results: List[Any], message: str) -> None:
+        """Raises every exception in results together, so the user sees all of the broken files at once."""
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            raise ExceptionGroup(f"{message} ({len(failures)} of {len(results)} files failed)", failures)
+
+
+    def _local_entries(self) -> Iterator[os.DirEntry]:
+        """
+        Every local file, as scandir entries (whose is_file and stat don't need extra system calls on most systems).
+        Goes through the shard folders if there are any. Blocking, step it from a thread.
+        """
+        if self.shard_depth:
+            yield from scan_files(self.base_dir, skip=self.META_DIR_NAME)
+            return
+        with os.scandir(self.base_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry
+
+    def _scan_local(self, page_size: int | None = None) -> Iterator[List[str]]:
+        """Lists local file names page_size at a time (all in one page if None). Blocking, step it from a thread."""
+        page: List[str] = []
+        names = self.segments.names() if self.segments is not None else (entry.name for entry in self._local_entries())
+        for name in names:
+            page.append(name)
+            if page_size is not None and len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def _list_local(self) -> List[str]:
+        return [name for page in self._scan_local() for name in page]
+
+    async def _iter_names(self) -> AsyncIterator[List[str]]:
+        """Pages of file names, each one only asked for after the last was used."""
+        if self.save_mode == SaveMode.remote_only:
+            async for page in self.remote_manager.iter_files():
+                if self.metadata_cache is not None:
+                    for name in page:
+                        self.metadata_cache.set(name, True)
+                yield page
+            return
+
+        pages = self._scan_local(self.LOCAL_PAGE_SIZE)
+        while (page := await asyncio.to_thread(next, pages, None)) is not None:
+            yield page
+
     async def _list_files(self) -> List[str]:
         files: List[str] = []
         match self.save_mode:
             case SaveMode.remote_only:
-                files = await self.remote_manager.list_files()
+                files = await self._remote_list_files()
 
             case SaveMode.local_only:
-                files = await asyncio.to_thread(lambda: [f.name for f in self.base_dir.iterdir() if f.is_file()])
+                files = await asyncio.to_thread(self._list_local)
 
 
             case SaveMode.remote_and_local:
-                remote_files = await self.remote_manager.list_files()
-                local_files = await asyncio.to_thread(lambda: [f.name for f in self.base_dir.iterdir() if f.is_file()])
+                remote_files = await self._remote_list_files()
+                local_files = await asyncio.to_thread(self._list_local)
+                if self.write_behind is not None: # What the remote will look like once it catches up
+                    remote_files = [f for f in remote_files if self._pending_remote(f) != "delete"]
+                    known = set(remote_files)
+                    remote_files += [f for f in local_files if self._pending_remote(f) == "write" and f not in known]
                 # Checks galore incoming
                 if len(remote_files) != len(local_files):
                     raise Exception("There is not an equal amount of files in both areas.")
+                remote_set = set(remote_files)
                 for file in local_files:
-                    if file not in remote_files:
+                    if file not in remote_set:
                         raise FileNotFoundError(f"Could not find file \"{file}\" in remote files, but it was  found in local files.")
-                    await self._check_contents(file)
+                # Every file has to be downloaded to compare, so do them side by side
+                results = await self._gather_limited(local_files, self._check_contents)
+                self._raise_failures(results, "Local and remote files do not match")
                 files = local_files # Doesn't matter which
-        return files
+        return sorted(files) # Sorted so the order doesn't depend on the file system or the remote
 
-    async def list_file_contents(self) -> List[FileFormat]:
+    @instrumented
+    @bulk
+    async def list_file_contents(self, concurrency: int | None = None, give_error = True) -> List[FileFormat]:
         """
         Does not list file names, because the user should never interact with file names.
         All the user is intended to do is give and take FileFormats.
+        Files are read `concurrency` at a time (defaults to the one given in __init__), and always come back sorted by file name.
+        If some files fail, all of them are raised together in an ExceptionGroup, unless give_error is False (then they are left out).
         """
-        file_contents: List[FileFormat] = []
         files: List[str] = await self._list_files()
+        results = await self._gather_limited(files, lambda file: self._read(file, check_exists=False, sanitize=False), concurrency)
+        if give_error:
+            self._raise_failures(results, "Could not read every file")
+        return [result for result in results if not isinstance(result, Exception)]
+
+
+    # Batch versions of read/write/delete. Every one gives back a result per file (in order), with the exception that
+    # file hit in its place, so one bad file doesn't fail the rest.
+
+    def _sanitize_many(self, files: Iterable[str | Path]) -> List[str | Exception]:
+        names: List[str | Exception] = []
         for file in files:
-            file_contents.append(await self._read(file, check_exists=False, sanitize=False))
-        return file_contents
\ No newline at end of file
+            try:
+                names.append(self._sanitize_file_name(file))
+            except Exception as e:
+                names.append(e)
+        return names
+
+    async def _exist_many(self, file_names: List[str]) -> List[bool]:
+        """Checks many sanitized files at once. Local files are checked in one thread hop, the remote in one listing if there are many."""
+        exists = [True] * len(file_names)
+        if self.save_mode != SaveMode.remote_only:
+            exists = await asyncio.to_thread(lambda: [self._local_exists(self._to_path(name)) for name in file_names])
+            if self.save_mode == SaveMode.local_only:
+                return exists
+
+        # Files write_behind hasn't sent yet only exist locally for now, the remote doesn't need to be asked
+        to_ask = [i for i, found in enumerate(exists) if found and self._pending_remote(file_names[i]) is None]
+        if len(to_ask) > self.BULK_LISTING_THRESHOLD:
+            remote_files = set(await self._remote_list_files())
+            remote_exists = [file_names[i] in remote_files for i in to_ask]
+        else:
+            remote_exists = await self._gather_limited([file_names[i] for i in to_ask], self._remote_exists)
+            self._raise_failures(remote_exists, "Could not check if files exist")
+
+        for i, found in zip(to_ask, remote_exists):
+            exists[i] = found
+        return exists
+
+    async def _checked_names(self, files: Iterable[str | Path], results: List[Any]) -> List[Tuple[int, str]]:
+        """Sanitizes and checks existence. Problems go into results, and (position, name) of the good files is returned."""
+        names = self._sanitize_many(files)
+        results.extend(names)
+        valid = [(i, name) for i, name in enumerate(names) if not isinstance(name, Exception)]
+        exists = await self._exist_many([name for _, name in valid])
+        found = []
+        for (i, name), exist in zip(valid, exists):
+            if exist:
+                found.append((i, name))
+            else:
+                results[i] = FileNotFoundError(f"File {name} does not exist")
+        return found
+
+    @staticmethod
+    def _each_local(func: Callable[..., Any], items: List[Tuple]) -> List[Any]:
+        """Runs func(*item) for every item. Meant to be run in one thread, so many small local files only take one hop."""
+        results = []
+        for item in items:
+            try:
+                results.append(func(*item))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @instrumented
+    @bulk
+    async def read_many(self, files: Iterable[str | Path]) -> List[FileFormat | Exception]:
+        """Reads many files. Gives back the FileFormat for each file (in order), or the exception it hit."""
+        results: List[FileFormat | Exception] = []
+        found = await self._checked_names(files, results)
+        read = await self._gather_limited([name for _, name in found], lambda name: self._read(name, check_exists=False, sanitize=False))
+        for (i, _), result in zip(found, read):
+            results[i] = result
+        return results
+
+    @instrumented
+    @bulk
+    async def write_many(self, files: Mapping[str | Path, FileFormat] | Iterable[Tuple[str | Path, FileFormat]],
+                         create_if_none = False) -> List[Exception | None]:
+        """
+        Writes many files, given as a dict of file: FileFormat or a list of (file, FileFormat).
+        Gives back None for each file that was written (in order), or the exception it hit.
+        Remote writes go through RemoteManager.write_many, so a remote with batch uploads only makes a few requests.
+        """
+        pairs = list(files.items()) if isinstance(files, Mapping) else list(files)
+        results: List[Exception | None] = []
+        names = self._sanitize_many(file for file, _ in pairs)
+        results.extend(name if isinstance(name, Exception) else None for name in names)
+        valid = [(i, name) for i, name in enumerate(names) if not isinstance(name, Exception)]
+        async with self._key_locks.hold_many(name for _, name in valid):
+            await self._write_many_locked(pairs, results, valid, create_if_none)
+        return results
+
+    async def _write_many_locked(self, pairs: List[Tuple[str | Path, FileFormat]], results: List[Exception | None],
+                                 valid: List[Tuple[int, str]], create_if_none: bool) -> None:
+        exists = await self._exist_many([name for _, name in valid])
+        missing = [(i, name) for (i, name), exist in zip(valid, exists) if not exist]
+        if create_if_none:
+            created = await self._gather_limited([name for _, name in missing], self._create_raw)
+            for (i, _), result in zip(missing, created):
+                results[i] = result
+        else:
+            for i, name in missing:
+                results[i] = FileNotFoundError(f"File {name} does not exist")
+
+        ready: List[Tuple[int, str, str]] = [] # (position, name, contents)
+        for i, name in valid:
+            if results[i] is not None:
+                continue
+            try:
+                ready.append((i, name, await self._encode(pairs[i][1])))
+            except Exception as e:
+                results[i] = e
+            self._forget_parsed(name)
+
+        remote_hashes: List[Any] = [None] * len(ready)
+        if self.save_mode == SaveMode.remote_only or (self.save_mode == SaveMode.remote_and_local and self.write_behind is None):
+            count_bytes(self.instrumentation, "remote_write", sum(len(contents) for _, _, contents in ready))
+            remote_hashes = await self.remote_manager.write_many([(name, contents) for _, name, contents in ready], self.concurrency)
+            for (i, name, _), result in zip(ready, remote_hashes):
+                if isinstance(result, Exception):
+                    results[i] = result
+                else:
+                    self._remote_changed(name, True)
+
+        if self.save_mode != SaveMode.remote_only:
+            local = [(i, name, contents, remote_hash) for (i, name, contents), remote_hash in zip(ready, remote_hashes) if results[i] is None]
+            written = await asyncio.to_thread(self._each_local, lambda name, contents: self._write_local(self._to_path(name), contents),
+                                              [(name, contents) for _, name, contents, _ in local])
+            for (i, name, contents, remote_hash), result in zip(local, written):
+                if isinstance(result, Exception):
+                    results[i] = result
+                    self._unindex_file(name) # Might be half written
+                elif self.write_behind is not None:
+                    self.manifest.delete(name)
+                    self.write_behind.enqueue(name, "write")
+                elif self.save_mode == SaveMode.remote_and_local:
+                    self._remember_hashes(name, self._digest(contents), remote_hash)
+        await self._index_many([(name, pairs[i][1]) for i, name, _ in ready if results[i] is None])
+        self._maybe_compact()
+
+    @instrumented
+    @bulk
+    async def delete_many(self, files: Iterable[str | Path]) -> List[Exception | None]:
+        """
+        Deletes many files. Gives back None for each file that was deleted (in order), or the exception it hit.
+        Remote deletes go through RemoteManager.delete_many, so a remote with batch deletes only makes a few requests.
+        """
+        files = list(files)
+        results: List[Exception | None] = []
+        async with self._key_locks.hold_many(name for name in self._sanitize_many(files) if not isinstance(name, Exception)):
+            await self._delete_many_locked(files, results)
+        return results
+
+    async def _delete_many_locked(self, files: List[str | Path], results: List[Exception | None]) -> None:
+        found = await self._checked_names(files, results)
+        for i, name in found:
+            results[i] = None
+            self._forget_parsed(name)
+
+        if self.save_mode == SaveMode.remote_only or (self.save_mode == SaveMode.remote_and_local and self.write_behind is None):
+            deleted = await self.remote_manager.delete_many([name for _, name in found], self.concurrency)
+            for (i, name), result in zip(found, deleted):
+                if isinstance(result, Exception):
+                    results[i] = result
+                else:
+                    self._remote_changed(name, False)
+                    self._unindex_file(name)
+
+        if self.save_mode != SaveMode.remote_only:
+            local = [(i, name) for i, name in found if results[i] is None]
+            deleted = await asyncio.to_thread(self._each_local, lambda name: self._unlink_local(self._to_path(name)),
+                                              [(name,) for _, name in local])
+            for (i, name), result in zip(local, deleted):
+                if isinstance(result, Exception):
+                    results[i] = result
+                    continue
+                self._unindex_file(name)
+                if self.save_mode == SaveMode.remote_and_local:
+                    self.manifest.delete(name)
+                    if self.write_behind is not None:
+                        self.write_behind.enqueue(name, "delete")
+        self._maybe_compact()
+
+    @instrumented_iterator
+    async def iter_file_contents(self, concurrency: int | None = None, give_error = True) -> AsyncIterator[FileFormat]:
+        """
+        Like list_file_contents, but gives the FileFormats one at a time with `async for`, as they are read.
+        At most `concurrency` files are read ahead, and names are listed a page at a time, so memory stays the same
+        however many files there are. Nothing more is read until the loop asks for the next one.
+        Files come in listing order (not sorted, that would need the whole listing first).
+        A failed file raises when it's reached, unless give_error is False (then it is skipped).
+        In remote_and_local, every file is checked against the remote as it is read, but files that are ONLY on the remote
+        are not found (list_file_contents does the full two-sided check).
+        """
+        limit = concurrency or self.concurrency
+        window: deque[asyncio.Task] = deque()
+
+        async def read(file: str) -> FileFormat:
+            # Only remote_and_local has to check existence, to be sure the remote has the local file too
+            return await self._read(file, check_exists=self.save_mode == SaveMode.remote_and_local, sanitize=False)
+
+        async def next_result() -> Tuple[bool, Any]:
+            task = window.popleft()
+            try:
+                return True, await task
+            except Exception:
+                if give_error:
+                    raise
+                return False, None
+
+        # Everything it sends is in the bulk lane. Only set around each step, never across a yield,
+        # or it would leak into the caller's loop body. The read tasks keep it, they copy the context they're made in.
+        pages = self._iter_names()
+        try:
+            while True:
+                with bulk_requests():
+                    page = await anext(pages, None)
+                if page is None:
+                    break
+                for file in page:
+                    with bulk_requests():
+                        window.append(asyncio.create_task(read(file)))
+                    if len(window) >= limit:
+                        ok, formatted = await next_result()
+                        if ok:
+                            yield formatted
+            while window:
+                ok, formatted = await next_result()
+                if ok:
+                    yield formatted
+        finally:
+            for task in window:
+                task.cancel()
+            await pages.aclose()
+
+
+    # Field index. FieldIndex keeps the values, these keep it in step with the files and use it.
+
+    def _index_stamp(self, file_name: str) -> List[int] | None:
+        """The local stamp, so check_index can skip files that haven't changed. None in remote_only. Blocking."""
+        if self.save_mode == SaveMode.remote_only:
+            return None
+        return self._local_stamp(self._to_path(file_name))
+
+    async def _index_many(self, items: List[Tuple[str | Path, FileFormat]]) -> None:
+        """Indexes (file, FileFormat) pairs that were just written."""
+        if self.field_index is None or not items:
+            return
+        names = [Path(file).name for file, _ in items]
+        stamps = await asyncio.to_thread(lambda: [self._index_stamp(name) for name in names])
+        for name, (_, formatted), stamp in zip(names, items, stamps):
+            self.field_index.update(name, formatted, stamp)
+
+    def _unindex_file(self, file: str | Path) -> None:
+        if self.field_index is not None:
+            self.field_index.remove(Path(file).name)
+
+    async def _reindex_local(self, file_name: str) -> None:
+        """For files changed under FileManager (like SyncEngine pulls): reads the local copy and indexes it."""
+        if self.field_index is None:
+            return
+        contents = await asyncio.to_thread(self._read_local, self._to_path(file_name))
+        await self._index_many([(file_name, await self._decode(contents))])
+
+    def _need_index(self) -> FieldIndex:
+        if self.field_index is None:
+            raise TypeError("Pass a field_index to FileManager to use find/query and the index checks.")
+        return self.field_index
+
+    @instrumented
+    @bulk
+    async def check_index(self, repair = False, concurrency: int | None = None) -> Dict[str, List[str]]:
+        """
+        Looks for files the index is wrong about, for when files were changed without FileManager.
+        Files whose mtime and size match what was indexed are trusted, every other file is read.
+        Gives back {"missing": not indexed, "stale": indexed with old values, "orphaned": indexed but gone}, each sorted.
+        :param repair: Also fix what was found, and mark the index as complete.
+        """
+        index = self._need_index()
+        names = await self._list_files()
+        present = set(names)
+        report: Dict[str, List[str]] = {"missing": [], "stale": [], "orphaned": [name for name in index.names() if name not in present]}
+
+        async def check(name: str) -> None:
+            entry = index.entry(name)
+            stamp = await asyncio.to_thread(self._index_stamp, name)
+            if entry is not None and stamp is not None and entry["stamp"] == stamp:
+                return
+            formatted = await self._read(name, check_exists=False, sanitize=False)
+            if entry is None:
+                report["missing"].append(name)
+            elif entry["keys"] != index.keys_of(formatted):
+                report["stale"].append(name)
+            if repair:
+                index.update(name, formatted, stamp)
+
+        results = await self._gather_limited(names, check, concurrency)
+        self._raise_failures(results, "Could not read every file to check the index")
+        if repair:
+            for name in report["orphaned"]:
+                index.remove(name)
+            index.set_ready(True)
+        return {problem: sorted(found) for problem, found in report.items()}
+
+    @instrumented
+    @bulk
+    async def rebuild_index(self, concurrency: int | None = None) -> None:
+        """Throws the index out and reads every file to make it again."""
+        self._need_index().clear()
+        await self.check_index(repair=True, concurrency=concurrency)
+
+    @instrumented
+    async def query(self, where: Callable[[FileFormat], bool] | None = None, concurrency: int | None = None,
+                    give_error = True, **criteria: Any) -> List[FileFormat]:
+        """
+        Gives the FileFormats whose indexed fields equal criteria (like info2=3) and, if given, that where(formatted) is True for.
+        Only the files the index matches are read. With no criteria every file has to be read, same as list_file_contents.
+        Sorted by file name. An index that was never completed is rebuilt first (once, it's saved after).
+        If some files fail, they are raised together in an ExceptionGroup, unless give_error is False (then they are left out).
+        """
+        if not criteria:
+            results = await self.list_file_contents(concurrency, give_error)
+            return [formatted for formatted in results if where is None or where(formatted)]
+
+        index = self._need_index()
+        if not index.ready:
+            await self.rebuild_index(concurrency)
+        names = sorted(index.lookup(criteria))
+        results = await self._gather_limited(names, lambda name: self._read(name, check_exists=True, sanitize=False), concurrency)
+        for i, (name, result) in enumerate(zip(names, results)):
+            if isinstance(result, FileNotFoundError): # Deleted without FileManager, so it shouldn't be in the index anyway
+                index.remove(name)
+                results[i] = None
+        if give_error:
+            self._raise_failures(results, "Could not read every matching file")
+
+        keys = {field_name: index.key(value) for field_name, value in criteria.items()}
+        found: List[FileFormat] = []
+        for formatted in results:
+            if formatted is None or isinstance(formatted, Exception):
+                continue
+            # The file may have changed without FileManager knowing, so what was read gets the final say
+            if any(index.key(getattr(formatted, field_name)) != key for field_name, key in keys.items()):
+                continue
+            if where is None or where(formatted):
+                found.append(formatted)
+        return found
+
+    @instrumented
+    async def find(self, concurrency: int | None = None, **criteria: Any) -> List[FileFormat]:
+        """query without a where: the FileFormats whose indexed fields equal criteria, like find(info2=3)."""
+        if not criteria:
+            raise ValueError("Give at least one field to find by, like find(info2=3).")
+        return await self.query(concurrency=concurrency, **criteria)
@@ -0,0 +1,278 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class OperationRecord:
+    """One public FileManager call, as given to Instrumentation.operation once it's done."""
+    name: str
+    seconds: float = 0.0
+    remote_calls: int = 0 # Every RemoteManager request made for it, background ones excluded
+    bytes: Dict[str, int] = field(default_factory=dict) # "local_read", "local_write", "remote_read", "remote_write" -> bytes
+    error: BaseException | None = None
+
+
+# The public call running right now in this task, so nested helpers and RemoteManager can add to it
+_current_operation: contextvars.ContextVar[OperationRecord | None] = contextvars.ContextVar("current_operation", default=None)
+
+
+def current_operation() -> OperationRecord | None:
+    return _current_operation.get()
+
+
+class Instrumentation:
+    """
+    Where FileManager and RemoteManager report what they're doing. This base class ignores everything, and is the default:
+    with enabled False nothing is even timed, so it costs about one attribute lookup per call.
+    Subclass it (set enabled = True, and override what you need) to send metrics wherever you want,
+    or use InMemoryInstrumentation.
+    Everything can be called from the event loop and from worker threads.
+    """
+    enabled: bool = False
+
+    def operation(self, record: OperationRecord) -> None:
+        """A public FileManager call finished (or failed, then record.error is set)."""
+        pass
+
+    def stage(self, name: str, seconds: float) -> None:
+        """
+        A step inside an operation finished: "sanitize", "exist", "check_contents", "decode" (interpreter.read)
+        or "encode" (interpreter.write).
+        """
+        pass
+
+    def remote_call(self, name: str, seconds: float, queue_wait: float, error: BaseException | None) -> None:
+        """
+        A RemoteManager request finished. name is the method without the underscore and _sync (like "read_bytes").
+        seconds is the time it ran, queue_wait how long it waited for a free thread in the RemoteManager's pool before.
+        """
+        pass
+
+    def bytes_moved(self, kind: str, count: int) -> None:
+        """count bytes (characters for text) went through kind: "local_read", "local_write", "remote_read" or "remote_write"."""
+        pass
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Times the with block as a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(name, time.perf_counter() - start)
+
+
+NO_INSTRUMENTATION = Instrumentation()
+
+
+def staged(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """For FileManager helpers (sync or async): times each call as the stage `name`, if self.instrumentation is on."""
+    def decorate(func: Callable[..., T]) -> Callable[..., T]:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args: Any, **kwargs: Any) -> T:
+                if not self.instrumentation.enabled:
+                    return await func(self, *args, **kwargs)
+                with self.instrumentation.timer(name):
+                    return await func(self, *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(self, *args: Any, **kwargs: Any) -> T:
+                if not self.instrumentation.enabled:
+                    return func(self, *args, **kwargs)
+                with self.instrumentation.timer(name):
+                    return func(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_bytes(instrumentation: Instrumentation, kind: str, count: int) -> None:
+    if not instrumentation.enabled:
+        return
+    record = _current_operation.get()
+    if record is not None:
+        record.bytes[kind] = record.bytes.get(kind, 0) + count
+    instrumentation.bytes_moved(kind, count)
+
+
+def instrumented(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    For public async FileManager methods: reports each call to self.instrumentation as one operation.
+    A public method called by another (like find calling query) counts as part of the outer one.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> T:
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled or _current_operation.get() is not None:
+            return await func(self, *args, **kwargs)
+
+        record = OperationRecord(name)
+        token = _current_operation.set(record)
+        start = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        except BaseException as e:
+            record.error = e
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            _current_operation.reset(token)
+            instrumentation.operation(record)
+
+    return wrapper
+
+
+def instrumented_iterator(func: Callable[..., AsyncIterator[T]]) -> Callable[..., AsyncIterator[T]]:
+    """
+    instrumented for public async generator methods (like iter_file_contents): the whole iteration is one operation.
+    The operation is only set while the generator runs, not while it waits at a yield, so what the caller does with
+    each item (like calling read) is its own operation. seconds only counts the time spent making the items.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> AsyncIterator[T]:
+        iterator = func(self, *args, **kwargs)
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled or _current_operation.get() is not None:
+            try:
+                async for item in iterator:
+                    yield item
+            finally:
+                await iterator.aclose()
+            return
+
+        record = OperationRecord(name)
+        try:
+            while True:
+                token = _current_operation.set(record)
+                start = time.perf_counter()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    record.seconds += time.perf_counter() - start
+                    _current_operation.reset(token)
+                yield item
+        except Exception as e:
+            record.error = e
+            raise
+        finally:
+            await iterator.aclose()
+            instrumentation.operation(record)
+
+    return wrapper
+
+
+class Histogram:
+    """Counts values (seconds) into fixed buckets that double in size, from 10 microseconds to about 2.5 minutes."""
+    BOUNDS: List[float] = [0.00001 * 2 ** i for i in range(25)]
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(self.BOUNDS) + 1) # The last one is everything past the biggest bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction: float) -> float:
+        """The upper bound of the bucket the value falls in, so never less than the real one. 0 if empty."""
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class InMemoryInstrumentation(Instrumentation):
+    """
+    Keeps everything in memory: counters, latency histograms and bytes, by name. Read it with snapshot().
+    Good for tests, and for printing now and then.
+    """
+    enabled = True
+
+    def __init__(self, max_records: int = 1000) -> None:
+        """:param max_records: How many of the latest OperationRecords to keep in records."""
+        self._lock = threading.Lock()
+        self.max_records = max_records
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.operations: Dict[str, Histogram] = {}
+            self.errors: Dict[str, int] = {}
+            self.remote_calls_per_operation: Dict[str, int] = {} # Total remote calls made by each kind of operation
+            self.stages: Dict[str, Histogram] = {}
+            self.remote_calls: Dict[str, Histogram] = {}
+            self.remote_errors: Dict[str, int] = {}
+            self.queue_wait = Histogram()
+            self.bytes: Dict[str, int] = {}
+            self.records: List[OperationRecord] = [] # The last max_records operations, newest last
+
+    def operation(self, record: OperationRecord) -> None:
+        with self._lock:
+            self.operations.setdefault(record.name, Histogram()).add(record.seconds)
+            if record.error is not None:
+                self.errors[record.name] = self.errors.get(record.name, 0) + 1
+            self.remote_calls_per_operation[record.name] = self.remote_calls_per_operation.get(record.name, 0) + record.remote_calls
+            self.records.append(record)
+            del self.records[:-self.max_records]
+
+    def stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).add(seconds)
+
+    def remote_call(self, name: str, seconds: float, queue_wait: float, error: BaseException | None) -> None:
+        with self._lock:
+            self.remote_calls.setdefault(name, Histogram()).add(seconds)
+            self.queue_wait.add(queue_wait)
+            if error is not None:
+                self.remote_errors[name] = self.remote_errors.get(name, 0) + 1
+
+    def bytes_moved(self, kind: str, count: int) -> None:
+        with self._lock:
+            self.bytes[kind] = self.bytes.get(kind, 0) + count
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything so far as plain dicts. Latencies are summaries in seconds (count, mean, p50, p99, max)."""
+        with self._lock:
+            return {
+                "operations": {name: {**histogram.summary(), "errors": self.errors.get(name, 0),
+                                      "remote_calls": self.remote_calls_per_operation.get(name, 0)}
+                               for name, histogram in self.operations.items()},
+                "stages": {name: histogram.summary() for name, histogram in self.stages.items()},
+                "remote_calls": {name: {**histogram.summary(), "errors": self.remote_errors.get(name, 0)}
+                                 for name, histogram in self.remote_calls.items()},
+                "queue_wait": self.queue_wait.summary(),
+                "bytes": dict(self.bytes),
+            }
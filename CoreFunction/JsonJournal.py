@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+
+class JsonJournal:
+    """
+    A small dict that lives on disk as an append-only file of JSON lines.
+    Every change is one appended line, so saving never rewrites the whole thing (that gets slow with many files).
+    When the log gets too much bigger than the dict it holds, it is compacted back down.
+    Used by FileManager for its bookkeeping files in base_dir/.filemanager
+    """
+    def __init__(self, path: str | Path, compact_ratio: float = 2.0) -> None:
+        """
+        :param path: Where the log is kept. The parent directory is made if needed.
+        :param compact_ratio: Compact once the log has this many times more lines than entries.
+        """
+        self.path = Path(path)
+        self.compact_ratio = compact_ratio
+        self._data: Dict[str, Any] = {}
+        self._lines = 0
+        self._lock = threading.Lock() # Can be called from the event loop and worker threads at the same time
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break # A half-written last line from a crash, everything before it is fine
+                self._lines += 1
+                if record.get("v") is None:
+                    self._data.pop(record["k"], None)
+                else:
+                    self._data[record["k"]] = record["v"]
+        self._maybe_compact()
+
+    def _append(self, key: str, value: Any) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as log:
+            log.write(json.dumps({"k": key, "v": value}) + "\n")
+        self._lines += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self._lines > 64 and self._lines > self.compact_ratio * len(self._data):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrites the log with one line per entry. Written to a temp file first so a crash can't lose the old log."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with temp.open("w", encoding="utf-8") as log:
+            for key, value in self._data.items():
+                log.write(json.dumps({"k": key, "v": value}) + "\n")
+        os.replace(temp, self.path)
+        self._lines = len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """Saves value under key. A value of None is the same as deleting."""
+        with self._lock:
+            if value is None:
+                if key not in self._data:
+                    return
+                self._data.pop(key)
+            else:
+                if self._data.get(key) == value:
+                    return # Nothing changed, don't grow the log
+                self._data[key] = value
+            self._append(key, value)
+
+    def delete(self, key: str) -> None:
+        self.set(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._compact()
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self._data.items()))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+class KeyLocks:
+    """
+    One asyncio.Lock per key (file name), so changes to the same file go one at a time while other files don't wait.
+    A lock is made when first needed and dropped as soon as nobody holds or waits for it, so idle files cost nothing.
+    Re-entrant per task: a task already holding a key can take it again (like _write calling _create).
+    """
+    def __init__(self) -> None:
+        self._locks: Dict[Hashable, List[Any]] = {} # key -> [lock, tasks holding or waiting, task holding it]
+
+    def held_here(self, key: Hashable) -> bool:
+        """If the running task holds key."""
+        entry = self._locks.get(key)
+        return entry is not None and entry[2] is asyncio.current_task()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        if self.held_here(key):
+            yield
+            return
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0, None])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                entry[2] = asyncio.current_task()
+                try:
+                    yield
+                finally:
+                    entry[2] = None
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    @contextlib.asynccontextmanager
+    async def hold_many(self, keys: Iterable[Hashable]) -> AsyncIterator[None]:
+        """Holds every key, taken in sorted order so two batches over the same keys can't deadlock."""
+        async with contextlib.AsyncExitStack() as stack:
+            for key in sorted(set(keys)):
+                await stack.enter_async_context(self.hold(key))
+            yield
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time: callers asking for a key that's already in flight wait for that call's result
+    instead of starting their own. Once it finishes the key is free again, nothing is cached.
+    A caller being cancelled doesn't cancel the call the others are waiting on.
+    """
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Gives back (result, shared), shared being True if the call was started by someone else."""
+        task = self._flights.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(func())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._landed(key, done))
+        return await asyncio.shield(task), shared
+
+    def _landed(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception() # Counts as retrieved, in case every caller was cancelled
+
+    def __len__(self) -> int:
+        return len(self._flights)
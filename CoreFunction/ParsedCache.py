@@ -0,0 +1,79 @@
+import copy
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+from CoreFunction.FileFormatABC import FileFormat
+
+
+class ParsedCache:
+    """
+    Keeps already-read FileFormats in memory, so reading a file that hasn't changed skips the I/O and the parsing.
+    Give one to FileManager. Entries are stored under the file name plus a fingerprint (like the local mtime and size),
+    so a changed file just misses instead of giving back old data. FileManager also throws entries out on write and delete.
+    The least recently used entries go first once max_entries or max_bytes is passed.
+    """
+    def __init__(self, max_entries: int | None = 1024, max_bytes: int | None = None, copy_on_return: bool = True) -> None:
+        """
+        :param max_entries: How many FileFormats are kept at most. None means no limit.
+        :param max_bytes: Roughly how much memory is used at most, going off of the size of the files read. None means no limit.
+        :param copy_on_return: Give back deep copies, so changing a FileFormat you were given can't change the cache.
+            Only turn this off if you never change what you read.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.copy_on_return = copy_on_return
+        self._entries: OrderedDict[str, tuple[Hashable, FileFormat, int]] = OrderedDict() # name -> (fingerprint, formatted, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_name: str, fingerprint: Hashable) -> FileFormat | None:
+        """Returns the FileFormat if it was cached with this same fingerprint, else None."""
+        entry = self._entries.get(file_name)
+        if entry is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(file_name)
+        self.hits += 1
+        return copy.deepcopy(entry[1]) if self.copy_on_return else entry[1]
+
+    def put(self, file_name: str, fingerprint: Hashable, formatted: FileFormat, size: int) -> None:
+        """:param size: About how big the FileFormat is. The length of the file it came from is good enough."""
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.invalidate(file_name)
+            return # Would throw everything else out, and still not fit
+        if self.copy_on_return:
+            formatted = copy.deepcopy(formatted) # The caller keeps the original, and might change it
+
+        self.invalidate(file_name)
+        self._entries[file_name] = (fingerprint, formatted, size)
+        self.bytes += size
+
+        while (self.max_entries is not None and len(self._entries) > self.max_entries) or \
+                (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self, file_name: str) -> None:
+        entry = self._entries.pop(file_name, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int | float]:
+        """Counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
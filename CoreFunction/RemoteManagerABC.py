@@ -2,27 +2,164 @@ from abc import ABC, abstractmethod
 
 from pathlib import Path
 
-from typing import List, final
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Tuple, TypeVar, final
 
 import asyncio
+import functools
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from CoreFunction.Instrumentation import NO_INSTRUMENTATION, Instrumentation, current_operation
+from CoreFunction.RequestScheduler import ErrorKind, RateLimitedError, RequestScheduler, bulk, current_priority
+from CoreFunction.Sharding import base_name, shard_name
+
+T = TypeVar("T")
 
 class RemoteManager(ABC):
     """
     DO NOT DO EXTRA EXCEPTION CHECKS!!!
     FileManager will deal with all cases, checking just wastes time.
+
+    The *_sync methods can be written as plain functions, or as `async def` if the remote has an async client.
+    Async ones are awaited directly. Plain ones run on this manager's own thread pool (max_workers threads),
+    not the event loop's default one, so remote calls and FileManager's local disk I/O don't wait on each other.
+    Every request goes through this manager's RequestScheduler first: it backs off when the remote throttles,
+    tries failed requests again, and lets interactive requests go before bulk ones. Raise RateLimitedError when the
+    remote says to slow down, or override _classify_error to teach it your client's errors.
     """
+    max_workers: int = 8 # Change on the class, or call set_max_workers before using the manager
+    instrumentation: Instrumentation = NO_INSTRUMENTATION # FileManager sets this to its own, if it was given one
+    shard_depth: int = 0 # FileManager sets these to its own shard layout. See _remote_name
+    shard_width: int = 2
+    scheduled: bool = True # False for managers that only pass requests on to other managers, which schedule their own
+    max_retries: int = 5 # See RequestScheduler for these
+    retry_base_delay: float = 0.1
+    retry_max_delay: float = 30.0
+
     @abstractmethod
     def __init__(self, *args):
         """Init the file system. Probably need authentication args."""
         pass
 
+    @property
+    @final
+    def executor(self) -> ThreadPoolExecutor:
+        """The thread pool the sync implementations run on. Made on first use, since subclasses don't call super().__init__"""
+        executor = self.__dict__.get("_executor")
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=type(self).__name__)
+            self._executor = executor
+        return executor
+
+    @property
+    @final
+    def scheduler(self) -> RequestScheduler:
+        """Decides when requests go out (see RequestScheduler). Made on first use, like executor."""
+        scheduler = self.__dict__.get("_scheduler")
+        if scheduler is None:
+            scheduler = RequestScheduler(self.max_workers, max_retries=self.max_retries, base_delay=self.retry_base_delay,
+                                         max_delay=self.retry_max_delay)
+            self._scheduler = scheduler
+        return scheduler
+
+    @final
+    def set_max_workers(self, max_workers: int) -> None:
+        """Changes how many remote calls can run at once. Calls already running finish on the old pool."""
+        if max_workers < 1:
+            raise ValueError("max_workers has to be at least 1.")
+        self.max_workers = max_workers
+        old = self.__dict__.pop("_executor", None)
+        if old is not None:
+            old.shutdown(wait=False)
+        scheduler = self.__dict__.get("_scheduler")
+        if scheduler is not None:
+            scheduler.max_concurrency = max_workers
+            scheduler.limit = min(scheduler.limit, max_workers)
+
+    def _classify_error(self, error: BaseException) -> Tuple[ErrorKind, float | None]:
+        """
+        Optional. Says whether a failed request is worth trying again: (ErrorKind, seconds the remote asked to wait or None).
+        By default RateLimitedError is throttling, ConnectionError and TimeoutError are transient, and everything else is fatal.
+        Override it to recognise your client's errors (like its 429 and 5xx ones). Only call transient what is safe to send
+        twice: a create that timed out might have worked.
+        """
+        if isinstance(error, RateLimitedError):
+            return ErrorKind.throttled, error.retry_after
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return ErrorKind.transient, None
+        return ErrorKind.fatal, None
+
+    @final
+    def close(self) -> None:
+        """Shuts the thread pool down. It is made again if the manager gets used after."""
+        executor = self.__dict__.pop("_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @final
+    async def _call(self, method: Callable[..., Any], *args: Any, name: str | None = None, retry: bool = True) -> Any:
+        """
+        Awaits async implementations, and runs sync ones on the thread pool. Requests wait for the scheduler first.
+        :param name: What to report the call as to instrumentation. Defaults to the method's name for *_sync methods,
+            anything else (like joining chunks) isn't a request, so it isn't reported or scheduled.
+        :param retry: False if the request can't be sent twice, like one reading its contents from an iterator.
+        """
+        if name is None and method.__name__.endswith("_sync"):
+            name = method.__name__.removeprefix("_").removesuffix("_sync")
+        if name is None or not self.scheduled:
+            return await self._attempt(method, args, name)
+        return await self.scheduler.run(lambda: self._attempt(method, args, name), self._classify_error, current_priority(), retry)
+
+    @final
+    async def _attempt(self, method: Callable[..., Any], args: Tuple, name: str | None) -> Any:
+        """One try of _call, reported to instrumentation (so every retry counts as its own request)."""
+        if not self.instrumentation.enabled or name is None:
+            if inspect.iscoroutinefunction(method):
+                return await method(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args))
+
+        record = current_operation()
+        if record is not None:
+            record.remote_calls += 1
+        submitted = time.perf_counter()
+        started = submitted
+
+        def run() -> Any:
+            nonlocal started
+            started = time.perf_counter()
+            return method(*args)
+
+        error = None
+        try:
+            if inspect.iscoroutinefunction(method):
+                return await method(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.instrumentation.remote_call(name, time.perf_counter() - started, started - submitted, error)
+
+    @final
+    def _remote_name(self, file_name: str) -> str:
+        """
+        Where a file is on the remote. With a shard_depth, that's inside hash-named folders, like "9f/3c/abc.json",
+        so the _*_sync methods get names with folders in front, and listings have to go into the folders (see
+        _list_files_sync). Names that already have folders are left alone.
+        """
+        if not self.shard_depth or "/" in file_name:
+            return file_name
+        return shard_name(file_name, self.shard_depth, self.shard_width)
+
     @final
     async def exists(self, file_name: str) -> bool:
         """
         Return a bool if the file exists; do not raise errors.
         Calls user-implemented function for async purposes.
         """
-        return await asyncio.to_thread(self._exists_sync, file_name)
+        return await self._call(self._exists_sync, self._remote_name(file_name))
 
     @abstractmethod
     def _exists_sync(self, file_name: str) -> bool:
@@ -35,20 +172,34 @@ class RemoteManager(ABC):
         Returns the entire file's contents as a string.
         Calls user-implemented function for async purposes.
         """
-        return await asyncio.to_thread(self._read_sync, file_name)
+        return await self._call(self._read_sync, self._remote_name(file_name))
 
     @abstractmethod
     def _read_sync(self, file_name: str) -> str:
         """Returns the entire file's contents as a string."""
         pass
 
+    @final
+    async def read_bytes(self, file_name: str) -> bytes:
+        """
+        Returns the entire file's contents as bytes, for binary FileInterpreters.
+        Uses _read_bytes_sync if it was implemented, else encodes what read gives (a wasted copy, so implement it if you can).
+        """
+        if self._implements("_read_bytes_sync"):
+            return await self._call(self._read_bytes_sync, self._remote_name(file_name))
+        return (await self.read(file_name)).encode()
+
+    def _read_bytes_sync(self, file_name: str) -> bytes:
+        """Optional. Returns the entire file's contents as bytes, without decoding them."""
+        raise NotImplementedError
+
     @final
     async def create(self, file_name: str) -> None:
         """
         Creates a file with the name "file_name".
         Calls user-implemented function for async purposes.
         """
-        await asyncio.to_thread(self._create_sync, file_name)
+        await self._call(self._create_sync, self._remote_name(file_name))
 
     @abstractmethod
     def _create_sync(self, file_name: str) -> str:
@@ -56,25 +207,47 @@ class RemoteManager(ABC):
         pass
 
     @final
-    async def write(self, file_name: str, file_contents: str) -> None:
+    async def write(self, file_name: str, file_contents: str) -> str | None:
         """
         Writes to a file that is already created.
+        Returns the file's new content hash if the implementation gives one back (see content_hash), else None.
         Calls user-implemented function for async purposes.
         """
-        await asyncio.to_thread(self._write_sync, file_name, file_contents)
+        return await self._call(self._write_sync, self._remote_name(file_name), file_contents)
 
     @abstractmethod
-    def _write_sync(self, file_name: str, file_contents: str) -> None:
-        """Writes to a file that is already created. DO NOT CREATE A FILE IN THIS IMPLEMENTATION."""
+    def _write_sync(self, file_name: str, file_contents: str) -> str | None:
+        """
+        Writes to a file that is already created. DO NOT CREATE A FILE IN THIS IMPLEMENTATION.
+        Optionally return the new content hash (same kind as _content_hash_sync) if the upload gives it for free.
+        """
         pass
 
+    @final
+    async def write_bytes(self, file_name: str, file_contents: bytes) -> str | None:
+        """
+        Writes bytes to a file that is already created, for binary FileInterpreters. Returns the same as write.
+        Uses _write_bytes_sync if it was implemented, else decodes them for write (only works for UTF-8, so implement it if you can).
+        """
+        if self._implements("_write_bytes_sync"):
+            return await self._call(self._write_bytes_sync, self._remote_name(file_name), file_contents)
+        try:
+            text = file_contents.decode()
+        except UnicodeDecodeError as e:
+            raise TypeError(f"{type(self).__name__} has no _write_bytes_sync, and these bytes are not UTF-8 text, so they can't be written.") from e
+        return await self.write(file_name, text)
+
+    def _write_bytes_sync(self, file_name: str, file_contents: bytes) -> str | None:
+        """Optional. Same as _write_sync, but with bytes, which are uploaded as they are. DO NOT CREATE A FILE HERE EITHER."""
+        raise NotImplementedError
+
     @final
     async def delete(self, file_name: str) -> None:
         """
         Deletes an already-made file.
         Calls user-implemented function for async purposes.
         """
-        await asyncio.to_thread(self._delete_sync, file_name)
+        await self._call(self._delete_sync, self._remote_name(file_name))
 
     @abstractmethod
     def _delete_sync(self, file_name: str) -> None:
@@ -87,9 +260,194 @@ class RemoteManager(ABC):
         Lists all files as names in strings.
         Calls user-implemented function for async purposes.
         """
-        return await asyncio.to_thread(self._list_files_sync)
+        names = await self._call(self._list_files_sync)
+        return [base_name(name) for name in names] if self.shard_depth else names
 
     @abstractmethod
     def _list_files_sync(self) -> List[str]:
-        """Lists all files as names in strings."""
-        pass
\ No newline at end of file
+        """
+        Lists all files as names in strings. If the remote lists in pages, get ALL of them (see _list_files_pages_sync).
+        With a shard_depth, list every folder under the root too (the names can be with or without their folders).
+        """
+        pass
+
+    @final
+    async def iter_files(self) -> AsyncIterator[List[str]]:
+        """
+        Lists all files page by page, so a huge folder never has to be held whole. The next page isn't asked for until
+        the last one was used. Uses _list_files_pages_sync if it was implemented, else gives list_files as one page.
+        """
+        if not self._implements("_list_files_pages_sync"):
+            yield await self.list_files()
+            return
+        pages = self._list_files_pages_sync()
+        while (page := await self._call(next, pages, None, name="list_files_pages", retry=False)) is not None: # A generator that raised is done
+            yield [base_name(name) for name in page] if self.shard_depth else page
+
+    def _list_files_pages_sync(self) -> Iterator[List[str]]:
+        """
+        Optional. Gives the names of all files one page at a time (a generator that follows the remote's cursor is easiest).
+        Has to be a plain (not async) function, it is stepped from the thread pool.
+        """
+        raise NotImplementedError
+
+    @final
+    def _implements(self, method_name: str) -> bool:
+        """True if the subclass overrode one of the optional methods below."""
+        return getattr(type(self), method_name) is not getattr(RemoteManager, method_name)
+
+    @property
+    @final
+    def has_content_hash(self) -> bool:
+        """True if the implementation gives content hashes, so FileManager can skip downloading files to compare them."""
+        return self._implements("_content_hash_sync")
+
+    @final
+    async def content_hash(self, file_name: str) -> str | None:
+        """
+        Returns a string that changes whenever the file's contents change (a hash or a revision), or None if unknown.
+        Calls user-implemented function for async purposes.
+        """
+        if not self.has_content_hash:
+            return None
+        return await self._call(self._content_hash_sync, self._remote_name(file_name))
+
+    def _content_hash_sync(self, file_name: str) -> str | None:
+        """
+        Optional. Return a hash or revision of the file from its metadata, WITHOUT downloading it.
+        It only has to be compared against itself, so any format works. Leave this alone if the remote can't do it.
+        """
+        return None
+
+    @property
+    def hash_scheme(self) -> str:
+        """
+        What kind of hash _content_hash_sync gives. Managers with the same hash_scheme give the same hash for the same
+        contents, so their hashes can be compared (ReplicatedRemoteManager uses it). Defaults to the class name, set it to
+        something like "sha256" if other classes hash the same way.
+        """
+        return type(self).__name__
+
+    @final
+    @bulk
+    async def write_many(self, files: List[Tuple[str, str | bytes]], concurrency: int = 16) -> List[str | Exception | None]:
+        """
+        Writes many already-created files. files is a list of (file_name, file_contents), the contents being str or bytes.
+        Gives back one result per file, in order: the new content hash (or None), or the exception that file hit.
+        Uses _write_many_sync if it was implemented, else writes the files one by one (up to concurrency at once).
+        """
+        if self._implements("_write_many_sync"):
+            return await self._call(self._write_many_sync, [(self._remote_name(name), contents) for name, contents in files])
+        return await self._each(files, lambda file: (self.write_bytes if isinstance(file[1], bytes) else self.write)(*file), concurrency)
+
+    def _write_many_sync(self, files: List[Tuple[str, str | bytes]]) -> List[str | Exception | None]:
+        """
+        Optional. Writes many already-created files in as few requests as possible. DO NOT CREATE FILES HERE EITHER.
+        Return one item per file, in order: the new content hash or None if it worked, the exception if it didn't.
+        Don't raise for one bad file, the others still need their results.
+        """
+        raise NotImplementedError
+
+    @final
+    @bulk
+    async def delete_many(self, file_names: List[str], concurrency: int = 16) -> List[Exception | None]:
+        """
+        Deletes many already-made files.
+        Gives back one result per file, in order: None if it was deleted, else the exception that file hit.
+        Uses _delete_many_sync if it was implemented, else deletes the files one by one (up to concurrency at once).
+        """
+        if self._implements("_delete_many_sync"):
+            return await self._call(self._delete_many_sync, [self._remote_name(name) for name in file_names])
+        return await self._each(file_names, self.delete, concurrency)
+
+    def _delete_many_sync(self, file_names: List[str]) -> List[Exception | None]:
+        """
+        Optional. Deletes many already-made files in as few requests as possible.
+        Return one item per file, in order: None if it worked, the exception if it didn't.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    async def _each(items: list, func, concurrency: int) -> list:
+        """The fallback for the *_many methods: one call per item, with the exception standing in for a failed one."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(item):
+            async with semaphore:
+                try:
+                    return await func(item)
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    @final
+    async def read_chunks(self, file_name: str, consume: Callable[[Iterator[str | bytes]], T], binary: bool = False) -> T:
+        """
+        Streams the file's contents, piece by piece, into consume (which runs on the thread pool), and gives back what it returns.
+        The pieces are bytes if binary, else str.
+        Uses _read_chunks_sync if it was implemented, else reads the whole file and gives it as one piece.
+        """
+        if self._implements("_read_chunks_sync"):
+            remote_name = self._remote_name(file_name)
+            return await self._call(lambda: consume(self._read_chunks_sync(remote_name, binary)), name="read_chunks")
+        contents = await (self.read_bytes(file_name) if binary else self.read(file_name))
+        return await self._call(consume, iter([contents]))
+
+    def _read_chunks_sync(self, file_name: str, binary: bool) -> Iterator[str | bytes]:
+        """
+        Optional. Gives the file's contents piece by piece (a generator is easiest), without holding the whole file.
+        Give bytes if binary, else str. Has to be a plain (not async) function, it is used from the thread pool.
+        """
+        raise NotImplementedError
+
+    @final
+    async def write_chunks(self, file_name: str, file_chunks: Iterable[str | bytes], binary: bool = False) -> str | None:
+        """
+        Writes to a file that is already created, taking the contents piece by piece (bytes if binary, else str). Returns the same as write.
+        file_chunks is used up on the thread pool, so it is fine for it to read from a local file.
+        Uses _write_chunks_sync if it was implemented, else joins the pieces and writes them in one go.
+        """
+        if self._implements("_write_chunks_sync"):
+            return await self._call(self._write_chunks_sync, self._remote_name(file_name), file_chunks, retry=False)
+        contents = await self._call((b"" if binary else "").join, file_chunks)
+        return await (self.write_bytes(file_name, contents) if binary else self.write(file_name, contents))
+
+    def _write_chunks_sync(self, file_name: str, file_chunks: Iterable[str | bytes]) -> str | None:
+        """
+        Optional. Writes to a file that is already created, uploading it piece by piece. DO NOT CREATE A FILE IN THIS IMPLEMENTATION.
+        The pieces can be str or bytes (str gets encoded to UTF-8).
+        Has to be a plain (not async) function, it is used from the thread pool. Returns the same as _write_sync.
+        """
+        raise NotImplementedError
+    @property
+    @final
+    def has_changes(self) -> bool:
+        """True if the implementation can list only what changed since a cursor (see _list_changes_sync)."""
+        return self._implements("_list_changes_sync")
+
+    @final
+    async def list_changes(self, cursor: str | None) -> Tuple[dict, str | None]:
+        """
+        Returns ({file_name: content hash, or None if it was deleted}, new cursor) for everything that changed since cursor.
+        A cursor of None gives every file (and never any deletes), to start from.
+        Uses _list_changes_sync if it was implemented. Else lists every file, with its content_hash if there is one
+        (or None), and gives back a None cursor, so every call is a full listing.
+        """
+        if self.has_changes:
+            changes, cursor = await self._call(self._list_changes_sync, cursor)
+            return ({base_name(name): content_hash for name, content_hash in changes.items()} if self.shard_depth else changes), cursor
+        names = await self.list_files()
+        hashes = await self._each(names, self.content_hash, 16) if self.has_content_hash else [None] * len(names)
+        for name, content_hash in zip(names, hashes):
+            if isinstance(content_hash, Exception):
+                raise content_hash
+        return dict(zip(names, hashes)), None
+
+    def _list_changes_sync(self, cursor: str | None) -> Tuple[dict, str]:
+        """
+        Optional. Returns ({file_name: content hash, or None if it was deleted}, new cursor) for everything since cursor.
+        With a cursor of None, give every file that exists, and a cursor for "now". Hashes have to be the same kind as
+        _content_hash_sync. If the cursor is too old to use, give every file again like cursor was None.
+        """
+        raise NotImplementedError
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+
+class RemoteMetadataCache:
+    """
+    Remembers which files exist on the remote, so FileManager doesn't have to ask the remote every time.
+    Give one to FileManager. It fills it from list_files, and keeps it right through its own create, write and delete.
+    Entries expire after ttl seconds, and the least recently used ones are thrown out past max_entries.
+    If something else changes the remote, the cache can be wrong for up to ttl seconds (call clear() if that matters).
+    """
+    def __init__(self, ttl: float | None = 60.0, max_entries: int | None = 100_000) -> None:
+        """
+        :param ttl: Seconds an entry is trusted for. None means forever.
+        :param max_entries: How many entries are kept at most. None means no limit.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict() # name -> (exists, expires at)
+        # After a full listing, any name not in the cache is known to not exist, until this time
+        self._complete_until: float = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expiry(self) -> float:
+        return float("inf") if self.ttl is None else time.monotonic() + self.ttl
+
+    def get(self, file_name: str) -> bool | None:
+        """Returns if the file exists, or None if the cache doesn't know."""
+        entry = self._entries.get(file_name)
+        now = time.monotonic()
+        if entry is not None:
+            exists, expires = entry
+            if expires > now:
+                self._entries.move_to_end(file_name)
+                self.hits += 1
+                return exists
+            del self._entries[file_name]
+
+        elif now < self._complete_until:
+            self.hits += 1
+            return False
+
+        self.misses += 1
+        return None
+
+    def set(self, file_name: str, exists: bool) -> None:
+        self._entries[file_name] = (exists, self._expiry())
+        self._entries.move_to_end(file_name)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                self._complete_until = 0.0 # Something was forgotten, so a missing name doesn't mean a missing file anymore
+
+    def fill(self, file_names: Iterable[str]) -> None:
+        """Takes a full listing of the remote. Every listed file exists, and every other one doesn't."""
+        file_names = list(file_names)
+        self._entries.clear()
+        for file_name in file_names:
+            self.set(file_name, True)
+        if self.max_entries is None or len(file_names) <= self.max_entries:
+            self._complete_until = self._expiry()
+
+    def invalidate(self, file_name: str) -> None:
+        """Forget about a file, so the next check asks the remote."""
+        self._entries.pop(file_name, None)
+        self._complete_until = 0.0
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._complete_until = 0.0
+
+    @property
+    def stats(self) -> Dict[str, int | float]:
+        """Counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,332 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from CoreFunction.RemoteManagerABC import RemoteManager
+
+
+class ReplicatedRemoteManager(RemoteManager):
+    """
+    Several RemoteManagers acting as one, so a slow or broken remote doesn't set how slow FileManager is.
+    Give it to FileManager like any other RemoteManager.
+
+    Changes (create, write, delete and their batches) go to every replica at once, and return as soon as write_quorum of
+    them worked. The rest finish in the background. A replica whose last change to a file failed or hasn't finished yet is
+    not read that file from, so with write_quorum below the replica count reads still see the newest copy
+    (as long as this object lives, it isn't saved anywhere).
+    Reads (exists, read, content_hash, list_files) are hedged: they go to the replica that has been fastest lately, and if it
+    hasn't answered within hedge_percentile of its recent latencies, to the next one too. The first answer wins.
+    A replica that fails is skipped for the next one straight away.
+
+    Content hashes don't depend on which replica gave them, so FileManager's saved hashes keep matching whichever replica
+    answers. If the replicas hash differently (see RemoteManager.hash_scheme), each hash is tagged with its scheme
+    ("sha256:abc"), so hashes that mean different things never match.
+    Listings come from one replica, which may not have caught up on changes that didn't reach it.
+    """
+    scheduled = False # Every replica schedules (and retries) its own requests, one more layer would only hold them back
+    def __init__(self, replicas: List[RemoteManager], write_quorum: int | None = None, hedge_percentile: float = 0.95,
+                 initial_hedge_delay: float = 0.05, max_hedges: int = 1, window: int = 100) -> None:
+        """
+        :param replicas: The RemoteManagers to keep copies on. Don't give them a shard layout, the one FileManager gives this
+            manager is set on every replica too (so they list the shard folders).
+        :param write_quorum: How many replicas a change has to work on before it returns. None means all of them.
+        :param hedge_percentile: How long to wait for the fastest replica before asking another, as a percentile (0 to 1)
+            of its recent latencies. Higher means fewer extra requests, lower means better tail latency.
+        :param initial_hedge_delay: The wait (in seconds) until a replica has had enough calls to know its latencies.
+        :param max_hedges: How many more replicas a slow read can go to. Failed ones are always moved past.
+        :param window: How many of the latest latencies are kept per replica.
+        """
+        if not replicas:
+            raise ValueError("Give at least one replica.")
+        if write_quorum is not None and not 1 <= write_quorum <= len(replicas):
+            raise ValueError(f"write_quorum has to be between 1 and the number of replicas ({len(replicas)}).")
+        self.replicas = replicas
+        schemes = sorted({replica.hash_scheme for replica in replicas})
+        self._same_hashes = len(schemes) == 1
+        self._hash_scheme = schemes[0] if self._same_hashes else "replicated(" + ",".join(schemes) + ")"
+        self._shard_depth, self._shard_width = RemoteManager.shard_depth, RemoteManager.shard_width
+        self.write_quorum = write_quorum if write_quorum is not None else len(replicas)
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.max_hedges = max_hedges
+        self.latencies: List[deque] = [deque(maxlen=window) for _ in replicas] # Seconds, newest last
+        self.hedges = 0 # Reads that had to ask another replica because the first was slow
+        self._seq = itertools.count()
+        self._latest: Dict[Tuple[int, str], int] = {} # (replica, file) -> the change that's still going on
+        self._unsure: Set[Tuple[int, str]] = set() # (replica, file) whose last change failed or isn't done
+        self._tails: Dict[Tuple[int, str], asyncio.Future] = {} # (replica, file) -> done when its newest change is
+        self._background: Set[asyncio.Task] = set()
+
+    # Shard layout. Names come to the replicas already sharded (which _remote_name leaves alone), but they need the layout
+    # too, to list inside the shard folders and give back names without them.
+
+    @property
+    def shard_depth(self) -> int:
+        return self._shard_depth
+
+    @shard_depth.setter
+    def shard_depth(self, shard_depth: int) -> None:
+        self._shard_depth = shard_depth
+        for replica in self.replicas:
+            replica.shard_depth = shard_depth
+
+    @property
+    def shard_width(self) -> int:
+        return self._shard_width
+
+    @shard_width.setter
+    def shard_width(self, shard_width: int) -> None:
+        self._shard_width = shard_width
+        for replica in self.replicas:
+            replica.shard_width = shard_width
+
+    # Latency
+
+    MIN_SAMPLES = 10 # Before this many calls, a replica's latencies say too little
+
+    @staticmethod
+    def _percentile(samples: deque, fraction: float) -> float:
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def _typical(self, replica: int) -> float:
+        """A replica's median latency. Ones that haven't been used yet count as instant, so they get tried."""
+        samples = self.latencies[replica]
+        return self._percentile(samples, 0.5) if samples else 0.0
+
+    def _hedge_delay(self) -> float:
+        """
+        hedge_percentile of the replica that's best at it: if a read takes longer than the best replica usually does
+        at worst, it's worth asking another.
+        """
+        known = [self._percentile(samples, self.hedge_percentile) for samples in self.latencies if len(samples) >= self.MIN_SAMPLES]
+        return min(known) if known else self.initial_hedge_delay
+
+    def _ranked(self, file_name: str | None = None) -> List[int]:
+        """Replicas fastest first, leaving out ones that might not have the newest file_name (unless every one might not)."""
+        ranked = sorted(range(len(self.replicas)), key=self._typical)
+        if file_name is None:
+            return ranked
+        fresh = [replica for replica in ranked if (replica, file_name) not in self._unsure]
+        return fresh or ranked
+
+    async def _timed(self, replica: int, call: Awaitable[Any], first: bool) -> Any:
+        """
+        Awaits a read, saving how long it took. Failures count too, they were at least that slow.
+        A first try that got abandoned counts (or a replica that got slow would stay first forever), but a hedge that lost
+        doesn't: it was only cut short because another answered, which says nothing about how slow it is.
+        Only reads are timed, so slow uploads don't make reads wait longer to hedge.
+        """
+        start = asyncio.get_running_loop().time()
+        try:
+            result = await call
+        except asyncio.CancelledError:
+            if first:
+                self.latencies[replica].append(asyncio.get_running_loop().time() - start)
+            raise
+        except BaseException:
+            self.latencies[replica].append(asyncio.get_running_loop().time() - start)
+            raise
+        self.latencies[replica].append(asyncio.get_running_loop().time() - start)
+        return result
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "median_latency": [self._typical(replica) for replica in range(len(self.replicas))],
+            "hedges": self.hedges,
+            "unsure": len(self._unsure),
+            "background": len(self._background),
+        }
+
+    # Reads
+
+    async def _hedged(self, file_name: str | None, call: Callable[[int, RemoteManager], Awaitable[Any]]) -> Any:
+        """Runs call on the fastest replica, and on the next ones if it's slow or fails. Gives back the first answer."""
+        order = self._ranked(file_name)
+        running: Dict[asyncio.Task, int] = {}
+        errors: List[BaseException] = []
+        tried = 0
+        hedges = 0
+
+        def launch() -> None:
+            nonlocal tried
+            replica = order[tried]
+            tried += 1
+            running[asyncio.ensure_future(self._timed(replica, call(replica, self.replicas[replica]), tried == 1))] = replica
+
+        launch()
+        try:
+            while running:
+                can_hedge = tried < len(order) and hedges < self.max_hedges
+                done, _ = await asyncio.wait(running, timeout=self._hedge_delay() if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done: # Too slow, ask the next one too
+                    hedges += 1
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    del running[task]
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                if not running and tried < len(order):
+                    launch()
+            raise errors[0]
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _exists_sync(self, file_name: str) -> bool:
+        return await self._hedged(file_name, lambda _, replica: replica.exists(file_name))
+
+    async def _read_sync(self, file_name: str) -> str:
+        return await self._hedged(file_name, lambda _, replica: replica.read(file_name))
+
+    async def _read_bytes_sync(self, file_name: str) -> bytes:
+        return await self._hedged(file_name, lambda _, replica: replica.read_bytes(file_name))
+
+    async def _content_hash_sync(self, file_name: str) -> str | None:
+        async def tagged(index: int, replica: RemoteManager) -> str | None:
+            return self._tag(index, await replica.content_hash(file_name))
+        return await self._hedged(file_name, tagged)
+
+    async def _list_files_sync(self) -> List[str]:
+        return await self._hedged(None, lambda _, replica: replica.list_files())
+
+    @property
+    def hash_scheme(self) -> str:
+        return self._hash_scheme
+
+    def _tag(self, replica: int, content_hash: str | None) -> str | None:
+        """A replica's hash as this manager gives it: as it is if every replica hashes the same way, else with its scheme."""
+        if content_hash is None or self._same_hashes:
+            return content_hash
+        return f"{self.replicas[replica].hash_scheme}:{content_hash}"
+
+    # Changes
+
+    def _started(self, replica: int, file_names: List[str]) -> Tuple[int, asyncio.Future, Set[asyncio.Future]]:
+        """
+        Queues a change behind the ones to the same files on the same replica (with a slow replica and a low write_quorum,
+        a newer write could otherwise land before an older one, leaving the older contents there).
+        Gives back its seq, the future to finish when it's done, and the earlier changes' futures it has to wait for.
+        Call it before the change starts, in the order the changes were asked for.
+        """
+        seq = next(self._seq)
+        done = asyncio.get_running_loop().create_future()
+        earlier = set()
+        for name in file_names:
+            key = (replica, name)
+            if key in self._tails and self._tails[key] is not done: # The same file twice in one batch doesn't wait on itself
+                earlier.add(self._tails[key])
+            self._tails[key] = done
+            self._latest[key] = seq
+            self._unsure.add(key)
+        return seq, done, earlier
+
+    def _finished(self, replica: int, file_names: List[str], seq: int, done: asyncio.Future, results: List[Any]) -> None:
+        """
+        Only the newest change to a file on a replica says if that replica is up to date on it.
+        Changes to a file finish in order, so once the newest one worked, every older one is done too.
+        """
+        done.set_result(None)
+        for name, result in zip(file_names, results):
+            key = (replica, name)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+            if self._latest.get(key) != seq:
+                continue
+            del self._latest[key]
+            if not isinstance(result, Exception):
+                self._unsure.discard(key)
+
+    async def _fan_out(self, file_names: List[str], call: Callable[[int, RemoteManager], Awaitable[List[Any]]]) -> List[Any]:
+        """
+        Runs call (which gives one result per file, exceptions in place) on every replica at once.
+        Returns once every file worked on write_quorum replicas or can't anymore, leaving the slower ones to finish.
+        Gives back per file the result of the fastest-ranked replica it worked on, or the exception if it missed the quorum.
+        """
+        count = len(self.replicas)
+        answers: List[Dict[int, Any]] = [{} for _ in file_names]
+
+        async def one(index: int, replica: RemoteManager, seq: int, done: asyncio.Future,
+                      earlier: Set[asyncio.Future]) -> Tuple[int, List[Any]]:
+            results: List[Any] = [Exception("Cancelled before it finished")] * len(file_names)
+            try:
+                if earlier:
+                    await asyncio.wait(earlier)
+                results = await call(index, replica)
+            except Exception as e:
+                results = [e] * len(file_names)
+            finally: # Even if cancelled, so the changes queued behind this one still go
+                self._finished(index, file_names, seq, done, results)
+            return index, results
+
+        def settled(answer: Dict[int, Any]) -> bool:
+            worked = sum(not isinstance(result, Exception) for result in answer.values())
+            return worked >= self.write_quorum or len(answer) - worked > count - self.write_quorum
+
+        pending = {asyncio.ensure_future(one(index, replica, *self._started(index, file_names)))
+                   for index, replica in enumerate(self.replicas)}
+        while pending and not all(settled(answer) for answer in answers):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, results = task.result()
+                for answer, result in zip(answers, results):
+                    answer[index] = result
+        for task in pending: # Slow replicas catch up in the background
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+        ranked = self._ranked()
+        results = []
+        for answer in answers:
+            worked = [index for index in ranked if index in answer and not isinstance(answer[index], Exception)]
+            if len(worked) >= self.write_quorum:
+                results.append(answer[worked[0]])
+            else:
+                results.append(next(answer[index] for index in ranked if index in answer and isinstance(answer[index], Exception)))
+        return results
+
+    async def _one_change(self, file_name: str, call: Callable[[int, RemoteManager], Awaitable[Any]]) -> Any:
+        async def listed(index: int, replica: RemoteManager) -> List[Any]:
+            return [await call(index, replica)]
+        result = (await self._fan_out([file_name], listed))[0]
+        if isinstance(result, Exception):
+            result.add_note(f"Fewer than write_quorum ({self.write_quorum}) of the {len(self.replicas)} replicas worked")
+            raise result
+        return result
+
+    async def _create_sync(self, file_name: str) -> str:
+        await self._one_change(file_name, lambda _, replica: replica.create(file_name))
+        return file_name
+
+    async def _write_sync(self, file_name: str, file_contents: str) -> str | None:
+        async def write(index: int, replica: RemoteManager) -> str | None:
+            return self._tag(index, await replica.write(file_name, file_contents))
+        return await self._one_change(file_name, write)
+
+    async def _write_bytes_sync(self, file_name: str, file_contents: bytes) -> str | None:
+        async def write(index: int, replica: RemoteManager) -> str | None:
+            return self._tag(index, await replica.write_bytes(file_name, file_contents))
+        return await self._one_change(file_name, write)
+
+    async def _delete_sync(self, file_name: str) -> None:
+        await self._one_change(file_name, lambda _, replica: replica.delete(file_name))
+
+    async def _write_many_sync(self, files: List[Tuple[str, str | bytes]]) -> List[str | Exception | None]:
+        async def write(index: int, replica: RemoteManager) -> List[Any]:
+            results = await replica.write_many(files)
+            return [result if isinstance(result, Exception) else self._tag(index, result) for result in results]
+        return await self._fan_out([name for name, _ in files], write)
+
+    async def _delete_many_sync(self, file_names: List[str]) -> List[Exception | None]:
+        return await self._fan_out(file_names, lambda _, replica: replica.delete_many(file_names))
+
+    async def wait_for_replicas(self) -> None:
+        """Waits for changes still going to slow replicas. Call before closing the replicas."""
+        while self._background:
+            await asyncio.wait(set(self._background))
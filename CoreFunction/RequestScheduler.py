@@ -0,0 +1,193 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import random
+from enum import Enum, IntEnum, auto
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Which lane a remote request waits in. Lower goes first."""
+    interactive = 0 # A single read, write... someone is waiting on right now
+    bulk = 1 # Batches, listings of everything, sync, write_behind uploads
+
+
+class ErrorKind(Enum):
+    """What RemoteManager._classify_error says about a failed request."""
+    fatal = auto() # Raise it, trying again won't help (missing file, bad auth...)
+    transient = auto() # Try again after a backoff (dropped connection, 5xx)
+    throttled = auto() # The remote wants fewer requests: back off, and send fewer at once from now on
+
+
+class RateLimitedError(Exception):
+    """Raise from a RemoteManager's _*_sync methods when the remote says to slow down (like an HTTP 429)."""
+    def __init__(self, message: str = "Rate limited", retry_after: float | None = None) -> None:
+        """:param retry_after: Seconds the remote asked to wait (its Retry-After), if it said."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("request_priority", default=Priority.interactive)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def bulk_requests() -> Iterator[None]:
+    """Remote requests made inside the with block (and by tasks started in it) go in the bulk lane."""
+    token = _priority.set(Priority.bulk)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def bulk(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """For async FileManager methods that move many files: every remote request they make goes in the bulk lane."""
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        with bulk_requests():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class RequestScheduler:
+    """
+    Decides when a RemoteManager's requests go out. Every RemoteManager makes its own (see RemoteManager.scheduler).
+    - At most `limit` requests at once. The limit adapts (AIMD): +1/limit per request that worked, so it creeps up to
+      max_concurrency, and halved every time the remote throttles. That finds about as many requests at once as the
+      remote will take, and stays there.
+    - A throttled request's Retry-After holds back every request, not just that one.
+    - Transient and throttled failures are tried again, up to max_retries times, with a jittered exponential backoff.
+    - Waiting requests go most urgent lane first (see Priority), then first come first served,
+      so an interactive read doesn't wait behind a thousand queued uploads.
+    Only used from the event loop.
+    """
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1, max_retries: int = 5,
+                 base_delay: float = 0.1, max_delay: float = 30.0) -> None:
+        """
+        :param max_concurrency: The most requests at once, ever. Also where the limit starts.
+        :param min_concurrency: The least the limit is cut to.
+        :param max_retries: How many more times a failed request is tried.
+        :param base_delay: Seconds the first retry waits (at most, it's jittered). Doubles every retry.
+        :param max_delay: The longest any one backoff can be, unless the remote asked for longer.
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self.retries = 0
+        self.throttles = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = [] # Heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0 # Loop time until which nothing is sent (Retry-After)
+        self._decreased_at = 0.0 # Requests sent before the last cut don't cut again, they saw the same overload
+        self._resume: asyncio.TimerHandle | None = None
+
+    # Slots
+
+    def _paused(self) -> bool:
+        return asyncio.get_running_loop().time() < self._paused_until
+
+    def _has_room(self) -> bool:
+        return self.active < max(int(self.limit), self.min_concurrency) and not self._paused()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to the waiting requests, most urgent first."""
+        while self._waiters and self._has_room():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done(): # Cancelled while waiting
+                continue
+            self.active += 1
+            future.set_result(None)
+        if self._waiters and self._paused() and self._resume is None:
+            loop = asyncio.get_running_loop()
+            self._resume = loop.call_at(self._paused_until, self._resumed)
+
+    def _resumed(self) -> None:
+        self._resume = None
+        self._dispatch()
+
+    async def _acquire(self, priority: Priority) -> None:
+        if not self._waiters and self._has_room():
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled(): # Got a slot just as it was cancelled, give it back
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    # Adapting
+
+    def _worked(self) -> None:
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _throttled(self, sent_at: float, retry_after: float | None) -> None:
+        self.throttles += 1
+        now = asyncio.get_running_loop().time()
+        if sent_at >= self._decreased_at:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self._decreased_at = now
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        """Full jitter: anywhere from 0 to base_delay * 2 ** attempt (capped), but never less than retry_after."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def run(self, request: Callable[[], Awaitable[T]], classify: Callable[[BaseException], Tuple[ErrorKind, float | None]],
+                  priority: Priority = Priority.interactive, retry: bool = True) -> T:
+        """
+        Sends request() once there's room for it, and again after a backoff if it fails in a way classify says is worth it.
+        :param retry: False for requests that can't be sent twice (like ones reading from a one-time iterator).
+        """
+        attempt = 0
+        while True:
+            await self._acquire(priority)
+            sent_at = asyncio.get_running_loop().time()
+            try:
+                result = await request()
+            except Exception as e:
+                kind, retry_after = classify(e)
+                if kind == ErrorKind.throttled:
+                    self._throttled(sent_at, retry_after)
+                if kind == ErrorKind.fatal or not retry or attempt >= self.max_retries:
+                    raise
+            else:
+                self._worked()
+                return result
+            finally:
+                self._release()
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    @property
+    def stats(self) -> Dict[str, float | int]:
+        return {
+            "limit": round(self.limit, 2),
+            "active": self.active,
+            "waiting": sum(not future.done() for _, _, future in self._waiters),
+            "retries": self.retries,
+            "throttles": self.throttles,
+        }
@@ -0,0 +1,281 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+class SegmentStore:
+    """
+    Keeps many small records packed into a few big append-only files ("segments"), instead of one file per record.
+    FileManager uses it for local_backend=LocalBackend.segments, the records being what would have been the files.
+
+    Every write or delete is one record appended to the newest segment:
+        header (magic, deleted flag, name length, contents length, crc32 of name + contents), name, contents
+    An index in memory says where the newest contents of every name are. Reads go through an mmap of the segment.
+    Old segments with too much overwritten or deleted data get compacted: what's still live is copied to the newest
+    segment, then the old one is deleted.
+
+    The index is saved to a snapshot once in a while (on compaction and close), and on open it is loaded, then every record
+    written after it is replayed. A record half-written during a crash fails its crc, and it and everything after it in
+    that segment are cut off. Without a (good) snapshot, every segment is scanned instead.
+    """
+    MAGIC = b"FMSR"
+    HEADER = struct.Struct("<4sBHII") # magic, deleted, name length, contents length, crc32
+    SNAPSHOT_NAME = "index.snapshot.json"
+
+    def __init__(self, directory: str | Path, max_segment_bytes: int = 64 * 1024 * 1024, compact_ratio: float = 0.5,
+                 durable: bool = False) -> None:
+        """
+        :param directory: Where the segments go. Made if needed.
+        :param max_segment_bytes: Start a new segment once the newest one is this big.
+        :param compact_ratio: Compact an old segment once this fraction of it is overwritten or deleted records.
+        :param durable: fsync after every write, so a write that returned survives a power cut. Slow, off by default.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_segment_bytes = max_segment_bytes
+        self.compact_ratio = compact_ratio
+        self.durable = durable
+        self._lock = threading.RLock()
+        self._index: Dict[str, Tuple[int, int, int]] = {} # name -> (segment, offset of contents, length of contents)
+        self._sizes: Dict[int, int] = {} # segment -> bytes written to it
+        self._dead: Dict[int, int] = {} # segment -> bytes of records that aren't live anymore
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._active = 0
+        self._file = None
+        self.compactions = 0
+        self._recover()
+
+    # Opening
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.dat"
+
+    def _segments_on_disk(self) -> List[int]:
+        return sorted(int(path.stem.split("-")[1]) for path in self.directory.glob("segment-*.dat"))
+
+    def _recover(self) -> None:
+        segments = self._segments_on_disk()
+        replay_from = {segment: 0 for segment in segments}
+        snapshot = self._load_snapshot()
+        if snapshot is not None and snapshot["sizes"] and all(int(segment) in replay_from for segment in snapshot["sizes"]):
+            known = {int(segment) for segment in snapshot["sizes"]}
+            for segment in [segment for segment in segments if segment not in known and segment < max(known)]:
+                # Compacted away, but the crash came before it was deleted. Its records were all copied somewhere newer
+                self._segment_path(segment).unlink()
+                segments.remove(segment)
+                del replay_from[segment]
+            self._index = {name: tuple(place) for name, place in snapshot["index"].items()}
+            self._dead = {int(segment): dead for segment, dead in snapshot["dead"].items()}
+            for segment, size in snapshot["sizes"].items():
+                replay_from[int(segment)] = size
+
+        for segment in segments:
+            self._replay(segment, replay_from[segment])
+        self._active = segments[-1] if segments else 1
+        self._open_active()
+
+    def _load_snapshot(self) -> dict | None:
+        try:
+            return json.loads((self.directory / self.SNAPSHOT_NAME).read_text())
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def _replay(self, segment: int, offset: int) -> None:
+        """Reads the records of a segment from offset on into the index. Cuts the segment off at the first bad record."""
+        path = self._segment_path(segment)
+        size = path.stat().st_size
+        with path.open("rb") as file:
+            file.seek(offset)
+            while offset + self.HEADER.size <= size:
+                header = file.read(self.HEADER.size)
+                magic, deleted, name_length, length, crc = self.HEADER.unpack(header)
+                end = offset + self.HEADER.size + name_length + length
+                if magic != self.MAGIC or end > size:
+                    break
+                name_bytes = file.read(name_length)
+                contents = file.read(length)
+                if zlib.crc32(name_bytes + contents) != crc:
+                    break
+                self._apply(name_bytes.decode(), None if deleted else (segment, offset + self.HEADER.size + name_length, length))
+                if deleted:
+                    self._dead[segment] = self._dead.get(segment, 0) + end - offset
+                self._sizes[segment] = end
+                offset = end
+        self._sizes.setdefault(segment, offset)
+        if offset < size: # A torn write from a crash (or garbage), nothing after it can be trusted
+            with path.open("r+b") as file:
+                file.truncate(offset)
+
+    def _apply(self, name: str, place: Tuple[int, int, int] | None) -> None:
+        """Points name at place (None for a delete), counting whatever it pointed at before as dead."""
+        old = self._index.pop(name, None)
+        if old is not None:
+            self._dead[old[0]] = self._dead.get(old[0], 0) + self._record_size(name, old[2])
+        if place is not None:
+            self._index[name] = place
+
+    def _record_size(self, name: str, length: int) -> int:
+        return self.HEADER.size + len(name.encode()) + length
+
+    def _open_active(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = self._segment_path(self._active).open("ab")
+        self._sizes.setdefault(self._active, self._file.tell())
+
+    # Reading and writing
+
+    def _append(self, name: str, contents: bytes, deleted: bool) -> Tuple[int, int, int]:
+        """Writes one record to the newest segment. Gives back where the contents went. Call with the lock held."""
+        if self._sizes[self._active] >= self.max_segment_bytes:
+            self._active += 1
+            self._open_active()
+        name_bytes = name.encode()
+        header = self.HEADER.pack(self.MAGIC, deleted, len(name_bytes), len(contents), zlib.crc32(name_bytes + contents))
+        offset = self._sizes[self._active]
+        self._file.write(header + name_bytes + contents)
+        self._file.flush()
+        if self.durable:
+            os.fsync(self._file.fileno())
+        self._sizes[self._active] = offset + len(header) + len(name_bytes) + len(contents)
+        return self._active, offset + len(header) + len(name_bytes), len(contents)
+
+    def put(self, name: str, contents: bytes) -> None:
+        with self._lock:
+            self._apply(name, self._append(name, contents, deleted=False))
+
+    def delete(self, name: str) -> None:
+        """Raises FileNotFoundError if there is no such record."""
+        with self._lock:
+            if name not in self._index:
+                raise FileNotFoundError(f"No record named {name}")
+            segment = self._append(name, b"", deleted=True)[0]
+            self._apply(name, None)
+            self._dead[segment] = self._dead.get(segment, 0) + self._record_size(name, 0) # The tombstone is dead weight too
+
+    def _map(self, segment: int, needed: int) -> mmap.mmap:
+        """An mmap of the segment that reaches at least `needed` bytes. The newest segment grows, so it's remapped if short."""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < needed:
+            if mapped is not None:
+                mapped.close()
+            with self._segment_path(segment).open("rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def get(self, name: str) -> bytes:
+        """Raises FileNotFoundError if there is no such record."""
+        with self._lock:
+            place = self._index.get(name)
+            if place is None:
+                raise FileNotFoundError(f"No record named {name}")
+            segment, offset, length = place
+            if length == 0:
+                return b""
+            return self._map(segment, offset + length)[offset:offset + length]
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self._index
+
+    def stamp(self, name: str) -> Tuple[int, int] | None:
+        """Changes every time the record is written, like a file's mtime. None if there is no such record."""
+        with self._lock:
+            place = self._index.get(name)
+        return None if place is None else (place[0], place[1])
+
+    def size(self, name: str) -> int:
+        with self._lock:
+            return self._index[name][2]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._index)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    # Compaction
+
+    def needs_compaction(self) -> bool:
+        with self._lock:
+            return bool(self._compactable())
+
+    def _compactable(self) -> List[int]:
+        return [segment for segment, size in self._sizes.items()
+                if segment != self._active and size and self._dead.get(segment, 0) >= size * self.compact_ratio]
+
+    def compact(self) -> int:
+        """
+        Copies the live records out of every old segment that is compact_ratio dead, and deletes those segments.
+        Gives back how many segments went. Safe to run from a thread while reads and writes go on: the lock is only
+        held per record, and a record written again meanwhile is left alone.
+        """
+        removed = 0
+        with self._lock: # puts add segments to _sizes from other threads
+            segments = self._compactable()
+        for segment in segments:
+            with self._lock:
+                live = [(name, place) for name, place in self._index.items() if place[0] == segment]
+            for name, place in live:
+                with self._lock:
+                    if self._index.get(name) != place: # Overwritten or deleted while compacting
+                        continue
+                    contents = self._map(segment, place[1] + place[2])[place[1]:place[1] + place[2]]
+                    self._index[name] = self._append(name, contents, deleted=False)
+            with self._lock:
+                if any(place[0] == segment for place in self._index.values()):
+                    continue
+                mapped = self._maps.pop(segment, None)
+                if mapped is not None:
+                    mapped.close()
+                # The snapshot has to stop pointing at the segment before it's gone
+                del self._sizes[segment]
+                self._dead.pop(segment, None)
+                self.save_snapshot()
+                self._segment_path(segment).unlink()
+                removed += 1
+        self.compactions += removed
+        return removed
+
+    def save_snapshot(self) -> None:
+        """Saves the index, so the next open only has to replay what was written after this."""
+        with self._lock:
+            if self.durable:
+                os.fsync(self._file.fileno())
+            snapshot = {
+                "index": self._index,
+                "sizes": {str(segment): size for segment, size in self._sizes.items()},
+                "dead": {str(segment): dead for segment, dead in self._dead.items()},
+            }
+            temp = self.directory / (self.SNAPSHOT_NAME + ".tmp")
+            temp.write_text(json.dumps(snapshot))
+            os.replace(temp, self.directory / self.SNAPSHOT_NAME)
+
+    def close(self) -> None:
+        with self._lock:
+            self.save_snapshot()
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "records": len(self._index),
+                "segments": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+                "dead_bytes": sum(self._dead.values()),
+                "compactions": self.compactions,
+            }
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Tuple
+
+if TYPE_CHECKING: # RemoteManager imports this file for the naming, so only import it back for type hints
+    from CoreFunction.RemoteManagerABC import RemoteManager
+
+LAYOUT_FILE = "layout.json" # In base_dir/.filemanager, says how the local (and remote) files are laid out
+
+
+def shard_dirs(file_name: str, shard_depth: int, shard_width: int) -> List[str]:
+    """
+    The folders a file goes in: shard_depth of them, each named by the next shard_width hex digits of the name's hash.
+    "abc.json" with a depth of 2 and a width of 2 -> ["9f", "3c"]
+    """
+    digest = hashlib.sha1(file_name.encode()).hexdigest()
+    return [digest[i * shard_width:(i + 1) * shard_width] for i in range(shard_depth)]
+
+
+def shard_name(file_name: str, shard_depth: int, shard_width: int) -> str:
+    """The file name with its shard folders in front, like "9f/3c/abc.json". Just the name for a depth of 0."""
+    return "/".join(shard_dirs(file_name, shard_depth, shard_width) + [file_name])
+
+
+def base_name(sharded_name: str) -> str:
+    """Undoes shard_name. Sanitized file names never have a "/" in them, so everything before the last one is shards."""
+    return sharded_name.rsplit("/", 1)[-1]
+
+
+def check_layout(shard_depth: int, shard_width: int) -> None:
+    if shard_depth < 0 or shard_width < 1:
+        raise ValueError("shard_depth can't be negative, and shard_width has to be at least 1.")
+    if shard_depth * shard_width > 40:
+        raise ValueError("shard_depth * shard_width can't be more than 40, the length of the hash.")
+
+
+def read_layout(meta_dir: Path) -> Tuple[int, int] | None:
+    """(shard_depth, shard_width) that was saved in meta_dir, or None if nothing was."""
+    path = meta_dir / LAYOUT_FILE
+    if not path.exists():
+        return None
+    layout = json.loads(path.read_text())
+    return layout["shard_depth"], layout["shard_width"]
+
+
+def write_layout(meta_dir: Path, shard_depth: int, shard_width: int) -> None:
+    meta_dir.mkdir(parents=True, exist_ok=True)
+    temp = meta_dir / (LAYOUT_FILE + ".tmp")
+    temp.write_text(json.dumps({"shard_depth": shard_depth, "shard_width": shard_width}))
+    os.replace(temp, meta_dir / LAYOUT_FILE)
+
+
+def scan_files(base_dir: Path, skip: str | None = None) -> Iterator[os.DirEntry]:
+    """Every file under base_dir, in any layout (flat or sharded), skipping the top level folder named skip. Blocking."""
+    folders = [base_dir]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry
+                elif entry.is_dir(follow_symlinks=False) and not (folder == base_dir and entry.name == skip):
+                    folders.append(Path(entry.path))
+
+
+def _move_local(base_dir: Path, meta_dir_name: str, shard_depth: int, shard_width: int) -> int:
+    moved = 0
+    for entry in list(scan_files(base_dir, skip=meta_dir_name)):
+        target = base_dir / shard_name(entry.name, shard_depth, shard_width)
+        if Path(entry.path) == target:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(entry.path, target)
+        moved += 1
+
+    # Shard folders left empty by the move. Deepest first, so emptied parents go too
+    for folder, _, _ in sorted(os.walk(base_dir), key=lambda walked: -len(walked[0])):
+        folder = Path(folder)
+        if folder != base_dir and meta_dir_name not in folder.relative_to(base_dir).parts and not any(folder.iterdir()):
+            folder.rmdir()
+    return moved
+
+
+async def _move_remote(remote_manager: "RemoteManager", shard_depth: int, shard_width: int, concurrency: int) -> int:
+    """Copies every remote file to where the new layout wants it, then deletes the old copy. Gives back how many moved."""
+    old = (remote_manager.shard_depth, remote_manager.shard_width)
+    names = await remote_manager.list_files() # In the old layout, which the manager still has
+    remote_manager.shard_depth = 0 # From here on, names are given with their shards already in front
+
+    async def move(file_name: str) -> bool:
+        source, target = shard_name(file_name, *old), shard_name(file_name, shard_depth, shard_width)
+        if source == target:
+            return False
+        contents = await remote_manager.read_bytes(source)
+        await remote_manager.create(target)
+        await remote_manager.write_bytes(target, contents)
+        await remote_manager.delete(source)
+        return True
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(file_name: str) -> bool:
+        async with semaphore:
+            return await move(file_name)
+
+    try:
+        moved = await asyncio.gather(*(limited(name) for name in names))
+    finally:
+        remote_manager.shard_depth, remote_manager.shard_width = shard_depth, shard_width
+    return sum(moved)
+
+
+async def reshard(base_dir: str | Path | None = None, remote_manager: "RemoteManager | None" = None, shard_depth: int = 2,
+                  shard_width: int = 2, concurrency: int = 16, meta_dir_name: str = ".filemanager") -> int:
+    """
+    Moves an existing store (flat, or sharded some other way) to a new layout, and gives back how many files were moved.
+    Give the same base_dir and/or remote_manager you give FileManager, and don't use them while this runs.
+    Local files are moved with renames. Remote ones are copied and then deleted, so a failure leaves the old copy
+    (running it again picks up where it stopped). Set remote_manager.shard_depth/shard_width to the layout the remote
+    is in now first (FileManager does that with its own layout).
+    Afterwards, make FileManager with the same shard_depth and shard_width.
+    """
+    check_layout(shard_depth, shard_width)
+    moved = 0
+    if base_dir is not None:
+        base_dir = Path(base_dir).resolve()
+        moved += await asyncio.to_thread(_move_local, base_dir, meta_dir_name, shard_depth, shard_width)
+    if remote_manager is not None:
+        moved += await _move_remote(remote_manager, shard_depth, shard_width, concurrency)
+    if base_dir is not None:
+        write_layout(base_dir / meta_dir_name, shard_depth, shard_width)
+    return moved
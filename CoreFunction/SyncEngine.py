@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from CoreFunction.JsonJournal import JsonJournal
+
+if TYPE_CHECKING: # FileManager imports this file, so only import it back for type hints
+    from CoreFunction.FileManager import FileManager
+
+
+@dataclass
+class SyncReport:
+    """What one FileManager.sync() did. Every list holds file names."""
+    pushed: List[str] = field(default_factory=list) # Local changes sent to the remote
+    pulled: List[str] = field(default_factory=list) # Remote changes brought down
+    deleted_remote: List[str] = field(default_factory=list)
+    deleted_local: List[str] = field(default_factory=list)
+    conflicts: Dict[str, str] = field(default_factory=dict) # Changed on both sides. file name -> what happened on each side
+    failed: Dict[str, Exception] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.pushed or self.pulled or self.deleted_remote or self.deleted_local)
+
+
+class SyncEngine:
+    """
+    Brings base_dir and the remote to the same state, only moving what changed since the last sync.
+    Keeps a checkpoint in base_dir/.filemanager: each file's local mtime, size and digest, and its remote hash, from the
+    last time both sides matched, plus the remote's change cursor if it has one (RemoteManager._list_changes_sync).
+    Local files are only re-hashed if their mtime or size moved, and the remote is only asked for changes since the cursor,
+    so a sync where nothing changed costs a directory scan and one remote call.
+    Use it through FileManager.sync().
+    """
+    def __init__(self, file_manager: "FileManager") -> None:
+        self.fm = file_manager
+        self.checkpoint = JsonJournal(file_manager.meta_dir / "sync.jsonl")
+        self.cursor_path = file_manager.meta_dir / "sync_cursor.json"
+
+    def _load_cursor(self) -> Tuple[str | None, Dict[str, str | None]]:
+        """The saved cursor, and the conflicts left unresolved last time (name -> remote hash then, None if deleted)."""
+        if not self.cursor_path.exists():
+            return None, {}
+        saved = json.loads(self.cursor_path.read_text())
+        return saved["cursor"], saved.get("conflicts", {})
+
+    def _save_cursor(self, cursor: str | None, conflicts: Dict[str, str | None]) -> None:
+        self.cursor_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cursor_path.write_text(json.dumps({"cursor": cursor, "conflicts": conflicts}))
+
+    def _scan_local(self) -> Dict[str, Tuple[int, int, str]]:
+        """name -> (mtime_ns, size, digest). Only files that look changed get read. Blocking, run it in a thread."""
+        found = {}
+        for entry in self.fm._local_entries():
+            stat = entry.stat()
+            known = self.checkpoint.get(entry.name)
+            if known is not None and known["mtime"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+                digest = known["local"]
+            else:
+                digest = self.fm._digest(self.fm._read_local(Path(entry.path)))
+            found[entry.name] = (stat.st_mtime_ns, stat.st_size, digest)
+        return found
+
+    async def _remote_state(self, cursor: str | None) -> Tuple[Dict[str, str | None], str | None, bool]:
+        """Returns ({name: remote hash, None if deleted}, new cursor, whether it was a full listing)."""
+        changes, new_cursor = await self.fm.remote_manager.list_changes(cursor)
+        full = cursor is None or not self.fm.remote_manager.has_changes
+
+        # A remote without hashes: the only way to see if a file changed is to download it. Slow, but still right.
+        unknown = [name for name, remote_hash in changes.items() if remote_hash is None and full]
+        digests = await self.fm._gather_limited(unknown, self._remote_digest)
+        self.fm._raise_failures(digests, "Could not download files to compare")
+        changes.update(zip(unknown, digests))
+        return changes, new_cursor, full
+
+    async def _remote_digest(self, file_name: str) -> str:
+        digest = await self.fm.remote_manager.read_chunks(file_name, self.fm._digest_chunks, self.fm.interpreter.binary)
+        return "sha256:" + digest
+
+    async def sync(self, conflict: str = "report", concurrency: int | None = None) -> SyncReport:
+        """
+        :param conflict: What to do with a file changed on both sides: "report" leaves both alone (and keeps reporting it
+            until it's fixed), "local" keeps the local copy, "remote" keeps the remote one.
+        """
+        if conflict not in ("report", "local", "remote"):
+            raise ValueError(f"Unknown conflict policy {conflict}")
+        report = SyncReport()
+        fm = self.fm
+        await fm.flush() # Anything write_behind still owes the remote would look like a local change otherwise
+
+        cursor, unresolved = self._load_cursor()
+        local = await asyncio.to_thread(self._scan_local)
+        remote, new_cursor, full = await self._remote_state(cursor)
+        if not full:
+            # The cursor is past the remote side of conflicts that were only reported, so it comes from the last sync instead.
+            # Newer remote changes to them are in the listing already, and win.
+            for name, remote_hash in unresolved.items():
+                remote.setdefault(name, remote_hash)
+
+        local_changed = {name for name, (_, _, digest) in local.items() if self.checkpoint.get(name, {}).get("local") != digest}
+        local_deleted = {name for name, _ in self.checkpoint.items() if name not in local}
+        remote_changed = {name for name, remote_hash in remote.items()
+                          if remote_hash is not None and self.checkpoint.get(name, {}).get("remote") != remote_hash}
+        if full:
+            remote_deleted = {name for name, _ in self.checkpoint.items() if name not in remote}
+        else:
+            remote_deleted = {name for name, remote_hash in remote.items() if remote_hash is None and name in self.checkpoint}
+
+        actions: List[Tuple[str, str]] = [] # (file name, action)
+        for name in sorted(local_changed | local_deleted | remote_changed | remote_deleted):
+            local_side = "changed" if name in local_changed else "deleted" if name in local_deleted else None
+            remote_side = "changed" if name in remote_changed else "deleted" if name in remote_deleted else None
+
+            if local_side is None:
+                actions.append((name, "pull" if remote_side == "changed" else "delete_local"))
+            elif remote_side is None:
+                actions.append((name, "push" if local_side == "changed" else "delete_remote"))
+            elif local_side == remote_side == "deleted":
+                actions.append((name, "forget"))
+            elif local_side == remote_side == "changed":
+                actions.append((name, "compare")) # Might have been changed the same way on both
+            else:
+                actions.append((name, self._resolve(name, local_side, remote_side, conflict, report)))
+
+        results = await fm._gather_limited(actions, lambda action: self._apply_locked(*action, local, remote, conflict, report),
+                                           concurrency)
+        for (name, _), result in zip(actions, results):
+            if isinstance(result, Exception):
+                report.failed[name] = result
+
+        # If anything failed, the same changes have to come back next time, so the old cursor is kept
+        if not report.failed:
+            self._save_cursor(new_cursor, {name: remote.get(name) for name in report.conflicts})
+        return report
+
+    @staticmethod
+    def _resolve(name: str, local_side: str, remote_side: str, conflict: str, report: SyncReport) -> str:
+        if conflict == "report":
+            report.conflicts[name] = f"{local_side} locally, {remote_side} on the remote"
+            return "skip"
+        if conflict == "local":
+            return "push" if local_side == "changed" else "delete_remote"
+        return "pull" if remote_side == "changed" else "delete_local"
+
+    async def _apply_locked(self, name: str, action: str, local: dict, remote: dict, conflict: str, report: SyncReport) -> None:
+        """_apply while holding the file, so FileManager calls on it wait for the sync (and the other way around)."""
+        async with self.fm._key_locks.hold(name):
+            await self._apply(name, action, local, remote, conflict, report)
+
+    async def _apply(self, name: str, action: str, local: dict, remote: dict, conflict: str, report: SyncReport) -> None:
+        fm = self.fm
+        fm._forget_parsed(name)
+        match action:
+            case "skip":
+                return
+
+            case "forget":
+                self.checkpoint.delete(name)
+                fm.manifest.delete(name)
+
+            case "compare":
+                known = fm.manifest.get(name) # FileManager may already know these two match
+                if known is not None and known["local"] == local[name][2] and known["remote"] == remote[name]:
+                    remote_digest = "sha256:" + local[name][2]
+                elif remote[name].startswith("sha256:"):
+                    remote_digest = remote[name]
+                else:
+                    remote_digest = await self._remote_digest(name)
+                if remote_digest == "sha256:" + local[name][2]:
+                    self._record(name, local[name], remote[name])
+                else:
+                    await self._apply(name, self._resolve(name, "changed", "changed", conflict, report), local, remote, conflict, report)
+
+            case "push":
+                await fm._replicate(name, "write")
+                known = fm.manifest.get(name)
+                remote_hash = known["remote"] if known is not None else "sha256:" + local[name][2]
+                self._record(name, local[name], remote_hash)
+                report.pushed.append(name)
+
+            case "delete_remote":
+                await fm._replicate(name, "delete")
+                self.checkpoint.delete(name)
+                report.deleted_remote.append(name)
+
+            case "pull":
+                path = fm._to_path(name)
+                temp = fm.meta_dir / f"{name}.download"
+                temp.parent.mkdir(exist_ok=True)
+                try:
+                    digest = await fm.remote_manager.read_chunks(name, lambda chunks: fm._write_local_chunks(temp, chunks),
+                                                                 fm.interpreter.binary)
+                    if fm.shard_depth: # A new file's shard folders might not be there yet
+                        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+                    await asyncio.to_thread(os.replace, temp, path)
+                finally:
+                    temp.unlink(missing_ok=True)
+                stat = await asyncio.to_thread(os.stat, path)
+                self._record(name, (stat.st_mtime_ns, stat.st_size, digest), remote[name])
+                fm._remote_changed(name, True)
+                await fm._reindex_local(name)
+                report.pulled.append(name)
+
+            case "delete_local":
+                await asyncio.to_thread(fm._to_path(name).unlink, missing_ok=True)
+                self.checkpoint.delete(name)
+                fm.manifest.delete(name)
+                fm._remote_changed(name, False)
+                fm._unindex_file(name)
+                report.deleted_local.append(name)
+
+    def _record(self, name: str, local: Tuple[int, int, str], remote_hash: str) -> None:
+        """Saves that both sides match now. Real remote hashes also go in FileManager's manifest, so reads can trust them."""
+        mtime, size, digest = local
+        self.checkpoint.set(name, {"mtime": mtime, "size": size, "local": digest, "remote": remote_hash})
+        self.fm._remember_hashes(name, digest, None if remote_hash.startswith("sha256:") else remote_hash)
@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Set, Tuple
+
+from CoreFunction.JsonJournal import JsonJournal
+
+
+class WriteBehindQueue:
+    """
+    Sends local changes to the remote in the background, for FileManager's write_behind option.
+    Only the file name and what happened to it ("write" or "delete") is queued. The upload reads whatever the local file
+    is at that time, so many writes to one file before its turn come out as one upload.
+    Everything queued is also saved in a journal, so after a crash the next FileManager picks up where this one stopped
+    (FileManager calls resume on its first operation, since the queue is made before there is an event loop).
+    Failed uploads are retried with a growing delay, and stay in the journal until they work.
+    """
+    def __init__(self, journal_path: str | Path, replicate: Callable[[str, str], Awaitable[None]], concurrency: int = 4,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0) -> None:
+        """
+        :param journal_path: Where the journal of pending uploads is kept.
+        :param replicate: Does the actual remote work for (file_name, "write" or "delete").
+        :param concurrency: How many uploads run at once.
+        """
+        self.replicate = replicate
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.journal = JsonJournal(journal_path)
+        # file name -> (operation, time it was first queued), in the order they were queued
+        self._pending: Dict[str, Tuple[str, float]] = {name: (entry["op"], entry["since"]) for name, entry in self.journal.items()}
+        self._in_flight: Dict[str, Tuple[str, float]] = {}
+        self._attempts: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self.uploaded = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.last_error: Exception | None = None
+
+    def enqueue(self, file_name: str, op: str) -> None:
+        """Queues a file to be made the same on the remote. Needs a running event loop."""
+        if op not in ("write", "delete"):
+            raise ValueError(f"Unknown operation {op}")
+        if file_name in self._pending:
+            self.coalesced += 1
+            since = self._pending[file_name][1]
+        else:
+            since = time.time()
+        self._pending[file_name] = (op, since)
+        self.journal.set(file_name, {"op": op, "since": since})
+        self._start()
+
+    def pending_op(self, file_name: str) -> str | None:
+        """What is still waiting to happen to this file on the remote ("write" or "delete"), or None if it's caught up."""
+        if file_name in self._pending:
+            return self._pending[file_name][0]
+        if file_name in self._in_flight:
+            return self._in_flight[file_name][0]
+        return None
+
+    def resume(self) -> None:
+        """Starts uploading what the journal had left from before, if anything. Cheap to call again. Needs a running event loop."""
+        if self._worker is None and self._pending:
+            self._start()
+
+    def _start(self) -> None:
+        self._idle.clear()
+        self._wake.set()
+        if self._worker is None or self._worker.done():
+            # A fresh context, or every upload would count toward the public call that happened to start the worker
+            self._worker = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self) -> None:
+        while True:
+            # A file that is already uploading waits, so an older upload can't finish after a newer one
+            ready = [name for name in self._pending if name not in self._in_flight]
+            available = self.concurrency - len(self._in_flight)
+            if not ready or available <= 0:
+                if not self._pending and not self._in_flight:
+                    self._idle.set()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            for name in ready[:available]:
+                op, since = self._pending.pop(name)
+                self._in_flight[name] = (op, since)
+                task = asyncio.create_task(self._replicate_one(name, op, since))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _replicate_one(self, file_name: str, op: str, since: float) -> None:
+        try:
+            await self.replicate(file_name, op)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            attempts = self._attempts.get(file_name, 0)
+            self._attempts[file_name] = attempts + 1
+            await asyncio.sleep(min(self.retry_delay * 2 ** attempts, self.max_retry_delay))
+            if file_name not in self._pending: # Newer changes already took its place otherwise
+                self._pending[file_name] = (op, since)
+        else:
+            self.uploaded += 1
+            self._attempts.pop(file_name, None)
+            if file_name not in self._pending:
+                self.journal.delete(file_name)
+        finally:
+            del self._in_flight[file_name]
+            self._wake.set()
+
+    async def flush(self, timeout: float | None = None) -> None:
+        """Waits until everything queued (including what was left in the journal) is on the remote."""
+        if not self._pending and not self._in_flight:
+            return
+        self._start()
+        await asyncio.wait_for(self._idle.wait(), timeout)
+
+    async def aclose(self, timeout: float | None = None) -> None:
+        """Flushes, then stops the background worker."""
+        try:
+            await self.flush(timeout)
+        finally:
+            if self._worker is not None:
+                self._worker.cancel()
+                self._worker = None
+
+    @property
+    def stats(self) -> Dict[str, int | float]:
+        """depth is how many files wait for the remote, lag is how many seconds the oldest one has waited."""
+        waiting = list(self._pending.values()) + list(self._in_flight.values())
+        return {
+            "depth": len(self._pending.keys() | self._in_flight.keys()),
+            "in_flight": len(self._in_flight),
+            "lag": time.time() - min(since for _, since in waiting) if waiting else 0.0,
+            "uploaded": self.uploaded,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+        }
@@ -1,15 +1,35 @@
+import codecs
+import time
+
 import dropbox
+import requests
 from pathlib import Path
-from typing import List
-from dropbox.files import WriteMode
+from typing import Iterable, Iterator, List, Tuple
+from dropbox.files import CommitInfo, DeleteArg, UploadSessionCursor, UploadSessionFinishArg, WriteMode
 
 from CoreFunction.RemoteManagerABC import RemoteManager
+from CoreFunction.RequestScheduler import ErrorKind
 
 
 class DropboxManager(RemoteManager):
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 # Dropbox takes up to 150 MB in one request, and whole files only up to that
+    LIST_PAGE_SIZE = 2000
+    hash_scheme = "dropbox" # Dropbox's content_hash, the same for the same contents on any account
+    BATCH_SIZE = 1000 # The most entries Dropbox takes in one batch commit or batch delete
+
     def __init__(self, access_token: str):
         self.dbx = dropbox.Dropbox(access_token)
 
+    def _classify_error(self, error: BaseException) -> Tuple[ErrorKind, float | None]:
+        """Dropbox's 429s say how long to back off, its 5xx and dropped connections are worth trying again."""
+        if isinstance(error, dropbox.exceptions.RateLimitError):
+            return ErrorKind.throttled, error.backoff
+        if isinstance(error, (dropbox.exceptions.InternalServerError, requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout)):
+            return ErrorKind.transient, None
+        return super()._classify_error(error)
+
     def _exists_sync(self, file_name: str) -> bool:
         """Return a bool if the file exists."""
         try:
@@ -22,8 +42,12 @@ class DropboxManager(RemoteManager):
 
     def _read_sync(self, file_name: str) -> str:
         """Returns the entire file's contents as a string."""
+        return self._read_bytes_sync(file_name).decode()
+
+    def _read_bytes_sync(self, file_name: str) -> bytes:
+        """Returns the entire file's contents as bytes."""
         metadata, res = self.dbx.files_download(f"/{file_name}")
-        return res.content.decode()
+        return res.content
 
     def _create_sync(self, file_name: str) -> str:
         """Creates a file with the name "file_name" """
@@ -31,9 +55,14 @@ class DropboxManager(RemoteManager):
         self.dbx.files_upload(b"", f"/{file_name}", mode=WriteMode.add)
         return file_name
 
-    def _write_sync(self, file_name: str, file_contents: str) -> None:
-        """Writes to a file that is already created."""
-        self.dbx.files_upload(file_contents.encode(), f"/{file_name}", mode=WriteMode.overwrite)
+    def _write_sync(self, file_name: str, file_contents: str) -> str:
+        """Writes to a file that is already created. Returns the new content hash."""
+        return self._write_bytes_sync(file_name, file_contents.encode())
+
+    def _write_bytes_sync(self, file_name: str, file_contents: bytes) -> str:
+        """Writes bytes to a file that is already created. Returns the new content hash."""
+        metadata = self.dbx.files_upload(file_contents, f"/{file_name}", mode=WriteMode.overwrite)
+        return metadata.content_hash
 
     def _delete_sync(self, file_name: str) -> None:
         """Deletes an already-made file."""
@@ -41,5 +70,128 @@ class DropboxManager(RemoteManager):
 
     def _list_files_sync(self) -> List[str]:
         """Lists all files as names in strings."""
-        entries = self.dbx.files_list_folder("").entries
-        return [entry.name for entry in entries if isinstance(entry, dropbox.files.FileMetadata)]
+        return [name for page in self._list_files_pages_sync() for name in page]
+
+    def _list_files_pages_sync(self) -> Iterator[List[str]]:
+        """files_list_folder only gives the first page, the rest have to be followed with the cursor."""
+        result = self.dbx.files_list_folder("", recursive=self.shard_depth > 0, limit=self.LIST_PAGE_SIZE)
+        while True:
+            yield [entry.name for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata)]
+            if not result.has_more:
+                break
+            result = self.dbx.files_list_folder_continue(result.cursor)
+
+    def _content_hash_sync(self, file_name: str) -> str:
+        """Dropbox keeps a content hash in the metadata, so nothing gets downloaded."""
+        return self.dbx.files_get_metadata(f"/{file_name}").content_hash
+
+
+    def _write_many_sync(self, files: List[Tuple[str, str]]) -> List[str | Exception | None]:
+        """
+        Uploads every file in its own session, then commits them in batches of up to BATCH_SIZE.
+        (Dropbox wants this for many files, separate uploads to one folder fight over a lock and get rate limited.)
+        """
+        results: List[str | Exception | None] = [None] * len(files)
+        entries: List[UploadSessionFinishArg] = []
+        positions: List[int] = []
+        for i, (file_name, file_contents) in enumerate(files):
+            data = file_contents if isinstance(file_contents, bytes) else file_contents.encode()
+            try:
+                session = self.dbx.files_upload_session_start(data, close=True)
+            except dropbox.exceptions.ApiError as e:
+                results[i] = e
+                continue
+            cursor = UploadSessionCursor(session_id=session.session_id, offset=len(data))
+            entries.append(UploadSessionFinishArg(cursor=cursor, commit=CommitInfo(path=f"/{file_name}", mode=WriteMode.overwrite)))
+            positions.append(i)
+
+        for start in range(0, len(entries), self.BATCH_SIZE):
+            finished = self.dbx.files_upload_session_finish_batch_v2(entries[start:start + self.BATCH_SIZE])
+            for i, entry in zip(positions[start:start + self.BATCH_SIZE], finished.entries):
+                if entry.is_success():
+                    results[i] = entry.get_success().content_hash
+                else:
+                    results[i] = Exception(f"Could not write {files[i][0]}: {entry.get_failure()}")
+        return results
+
+    def _delete_many_sync(self, file_names: List[str]) -> List[Exception | None]:
+        """Deletes in batch jobs of up to BATCH_SIZE files. A batch that fails as a whole fails each of its files."""
+        results: List[Exception | None] = []
+        for start in range(0, len(file_names), self.BATCH_SIZE):
+            results.extend(self._delete_batch_sync(file_names[start:start + self.BATCH_SIZE]))
+        return results
+
+    def _delete_batch_sync(self, file_names: List[str]) -> List[Exception | None]:
+        """Deletes one batch of files in one batch job, and waits for it to finish."""
+        job = self.dbx.files_delete_batch([DeleteArg(f"/{file_name}") for file_name in file_names])
+        if job.is_async_job_id():
+            job_id = job.get_async_job_id()
+            while True:
+                job = self.dbx.files_delete_batch_check(job_id)
+                if not job.is_in_progress():
+                    break
+                time.sleep(0.5)
+        if job.is_failed():
+            return [Exception(f"Batch delete failed: {job.get_failed()}")] * len(file_names)
+
+        results: List[Exception | None] = []
+        for file_name, entry in zip(file_names, job.get_complete().entries):
+            results.append(None if entry.is_success() else Exception(f"Could not delete {file_name}: {entry.get_failure()}"))
+        return results
+
+    def _read_chunks_sync(self, file_name: str, binary: bool) -> Iterator[str | bytes]:
+        """Gives the download as it comes in (decoding it if not binary), instead of holding the whole body."""
+        metadata, res = self.dbx.files_download(f"/{file_name}")
+        with res:
+            if binary:
+                yield from res.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE)
+                return
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for chunk in res.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    def _write_chunks_sync(self, file_name: str, file_chunks: Iterable[str | bytes]) -> str:
+        """Uploads through an upload session, UPLOAD_CHUNK_SIZE at a time. Small files still go up in one request."""
+        buffer = bytearray()
+        session_id = None
+        offset = 0
+        for chunk in file_chunks:
+            buffer += chunk if isinstance(chunk, bytes) else chunk.encode()
+            while len(buffer) >= self.UPLOAD_CHUNK_SIZE:
+                data = bytes(buffer[:self.UPLOAD_CHUNK_SIZE])
+                del buffer[:self.UPLOAD_CHUNK_SIZE]
+                if session_id is None:
+                    session_id = self.dbx.files_upload_session_start(data).session_id
+                else:
+                    self.dbx.files_upload_session_append_v2(data, UploadSessionCursor(session_id=session_id, offset=offset))
+                offset += len(data)
+
+        if session_id is None:
+            return self.dbx.files_upload(bytes(buffer), f"/{file_name}", mode=WriteMode.overwrite).content_hash
+        cursor = UploadSessionCursor(session_id=session_id, offset=offset)
+        commit = CommitInfo(path=f"/{file_name}", mode=WriteMode.overwrite)
+        return self.dbx.files_upload_session_finish(bytes(buffer), cursor, commit).content_hash
+
+    def _list_changes_sync(self, cursor: str | None) -> Tuple[dict, str]:
+        """Uses list_folder cursors, so a sync only hears about what changed."""
+        changes: dict = {}
+        if cursor is None:
+            result = self.dbx.files_list_folder("", recursive=self.shard_depth > 0, limit=self.LIST_PAGE_SIZE)
+        else:
+            try:
+                result = self.dbx.files_list_folder_continue(cursor)
+            except dropbox.exceptions.ApiError as e:
+                if isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset():
+                    return self._list_changes_sync(None) # Dropbox threw the cursor away, start over
+                raise
+
+        while True:
+            for entry in result.entries:
+                if isinstance(entry, dropbox.files.FileMetadata):
+                    changes[entry.name] = entry.content_hash
+                elif isinstance(entry, dropbox.files.DeletedMetadata):
+                    changes[entry.name] = None
+            if not result.has_more:
+                return changes, result.cursor
+            result = self.dbx.files_list_folder_continue(result.cursor)
\ No newline at end of file
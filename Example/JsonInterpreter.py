@@ -1,5 +1,6 @@
 import json
 from dataclasses import fields
+from typing import Iterator
 
 from CoreFunction.FileInterpreterABC import FileInterpreter
 from TestFormat import TestFormat
@@ -18,6 +19,11 @@ class JsonInterpreter(FileInterpreter):
             format_dict[field.name] = getattr(formatted, field.name)
         return json.dumps(format_dict, indent=4)
 
+    def write_chunks(self, formatted: TestFormat) -> Iterator[str]:
+        """Same text as write, but given piece by piece while it is being made."""
+        format_dict = {field.name: getattr(formatted, field.name) for field in fields(formatted)}
+        return json.JSONEncoder(indent=4).iterencode(format_dict)
+
 
     def read(self, file_contents: str) -> TestFormat:
         """
@@ -0,0 +1,203 @@
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from CoreFunction.RemoteManagerABC import RemoteManager
+from CoreFunction.RequestScheduler import RateLimitedError
+
+
+class SimulatedRemoteError(ConnectionError):
+    """What error injection raises, so tests can tell it apart from real bugs."""
+    pass
+
+
+class SimulatedRateLimitError(RateLimitedError):
+    """What a call past max_concurrent raises, like an HTTP 429."""
+    pass
+
+
+class SimulatedRemoteManager(RemoteManager):
+    """
+    A stand-in remote that needs no account: files live in memory (or in a local directory), and every call waits like a
+    network request would. Meant for benchmarks and for trying FileManager without a real remote.
+    Every call waits latency (plus up to jitter more), and transfers also wait their size / bandwidth.
+    Calls run on the RemoteManager thread pool like a real blocking client, so max_workers limits them the same way.
+    Counts every call it gets in `calls`, by name (the batch ones count once per batch, like one request would).
+    With max_concurrent, calls past that many at once are turned away like a rate-limited API would (and counted in
+    `throttled`), which is what RequestScheduler is there to handle.
+    """
+    LIST_PAGE_SIZE = 1000
+    hash_scheme = "sha256"
+
+    def __init__(self, root: str | Path | None = None, latency: float = 0.0, jitter: float = 0.0,
+                 bandwidth: float | None = None, error_rate: float = 0.0, seed: int | None = None,
+                 max_concurrent: int | None = None, retry_after: float | None = None):
+        """
+        :param root: A directory to keep the files in. None keeps them in memory.
+        :param latency: Seconds every call waits.
+        :param jitter: Up to this many more seconds, picked at random per call.
+        :param bandwidth: Bytes per second for reads and writes. None means instant.
+        :param error_rate: The chance (0 to 1) that a call raises SimulatedRemoteError instead of doing anything.
+        :param seed: Seeds the jitter and errors, so runs can be repeated.
+        :param max_concurrent: How many calls can be going on at once before the next raises SimulatedRateLimitError.
+            None means any number.
+        :param retry_after: The Retry-After (seconds) those errors carry. None sends none.
+        """
+        self.root = Path(root) if root is not None else None
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.throttled = 0
+        self._in_flight = 0
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self._files: Dict[str, bytes] = {}
+        self._changes: List[str] = [] # Every file name changed, in order. A cursor is an index into it
+        self._lock = threading.Lock()
+
+    def _request(self, name: str) -> None:
+        """Counts the call, waits like the network would, and maybe fails."""
+        with self._lock:
+            self.calls[name] += 1
+            if self.max_concurrent is not None and self._in_flight >= self.max_concurrent:
+                self.throttled += 1
+                raise SimulatedRateLimitError(f"Too many requests ({name})", self.retry_after)
+            self._in_flight += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        try:
+            if delay > 0:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if failed:
+            raise SimulatedRemoteError(f"Simulated {name} failure")
+
+    def _transfer(self, size: int) -> None:
+        if self.bandwidth is not None and size > 0:
+            time.sleep(size / self.bandwidth)
+
+    def reset_calls(self) -> None:
+        self.calls.clear()
+
+    # Storage, without any waiting
+
+    def _get(self, file_name: str) -> bytes:
+        if self.root is not None:
+            return (self.root / file_name).read_bytes()
+        with self._lock:
+            if file_name not in self._files:
+                raise FileNotFoundError(f"{file_name} is not on the remote")
+            return self._files[file_name]
+
+    def _put(self, file_name: str, file_contents: bytes) -> str:
+        if self.root is not None:
+            path = self.root / file_name
+            path.parent.mkdir(parents=True, exist_ok=True) # Shard folders
+            path.write_bytes(file_contents)
+        with self._lock:
+            if self.root is None:
+                self._files[file_name] = file_contents
+            self._changes.append(file_name)
+        return hashlib.sha256(file_contents).hexdigest()
+
+    def _remove(self, file_name: str) -> None:
+        if self.root is not None:
+            (self.root / file_name).unlink()
+        with self._lock:
+            if self.root is None:
+                del self._files[file_name]
+            self._changes.append(file_name)
+
+    def _has(self, file_name: str) -> bool:
+        if self.root is not None:
+            return (self.root / file_name).is_file()
+        with self._lock:
+            return file_name in self._files
+
+    def _names(self) -> List[str]:
+        if self.root is not None:
+            return sorted(path.relative_to(self.root).as_posix() for path in self.root.rglob("*") if path.is_file())
+        with self._lock:
+            return sorted(self._files)
+
+    # RemoteManager
+
+    def _exists_sync(self, file_name: str) -> bool:
+        self._request("exists")
+        return self._has(file_name)
+
+    def _read_sync(self, file_name: str) -> str:
+        return self._read_bytes_sync(file_name).decode()
+
+    def _read_bytes_sync(self, file_name: str) -> bytes:
+        self._request("read")
+        contents = self._get(file_name)
+        self._transfer(len(contents))
+        return contents
+
+    def _create_sync(self, file_name: str) -> str:
+        self._request("create")
+        self._put(file_name, b"")
+        return file_name
+
+    def _write_sync(self, file_name: str, file_contents: str) -> str:
+        return self._write_bytes_sync(file_name, file_contents.encode())
+
+    def _write_bytes_sync(self, file_name: str, file_contents: bytes) -> str:
+        self._request("write")
+        self._transfer(len(file_contents))
+        return self._put(file_name, file_contents)
+
+    def _delete_sync(self, file_name: str) -> None:
+        self._request("delete")
+        self._remove(file_name)
+
+    def _list_files_sync(self) -> List[str]:
+        return [name for page in self._list_files_pages_sync() for name in page]
+
+    def _list_files_pages_sync(self) -> Iterator[List[str]]:
+        names = self._names()
+        for start in range(0, max(len(names), 1), self.LIST_PAGE_SIZE):
+            self._request("list")
+            yield names[start:start + self.LIST_PAGE_SIZE]
+
+    def _content_hash_sync(self, file_name: str) -> str | None:
+        self._request("content_hash")
+        return hashlib.sha256(self._get(file_name)).hexdigest()
+
+    def _write_many_sync(self, files: List[Tuple[str, str | bytes]]) -> List[str | Exception | None]:
+        """One request for the whole batch, like an upload batch would be."""
+        encoded = [(name, contents.encode() if isinstance(contents, str) else contents) for name, contents in files]
+        self._request("write_many")
+        self._transfer(sum(len(contents) for _, contents in encoded))
+        return [self._put(name, contents) for name, contents in encoded]
+
+    def _delete_many_sync(self, file_names: List[str]) -> List[Exception | None]:
+        self._request("delete_many")
+        results: List[Exception | None] = []
+        for name in file_names:
+            try:
+                self._remove(name)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _list_changes_sync(self, cursor: str | None) -> Tuple[dict, str]:
+        self._request("list_changes")
+        with self._lock:
+            position = len(self._changes)
+            changed = set(self._changes[int(cursor):]) if cursor is not None else None
+        names = self._names() if changed is None else sorted(changed)
+        return {name: hashlib.sha256(self._get(name)).hexdigest() if self._has(name) else None for name in names}, str(position)
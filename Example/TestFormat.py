@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Any
 
 from CoreFunction.FileFormatABC import FileFormat
@@ -6,5 +6,5 @@ from CoreFunction.FileFormatABC import FileFormat
 @dataclass
 class TestFormat(FileFormat):
     info1: str
-    info2: int
+    info2: int = field(metadata={"index": True})
     info3: List[Any]
\ No newline at end of file
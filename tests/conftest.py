@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The tests import like the examples do: CoreFunction from the repository root, and the example classes by name
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "Example")]
@@ -0,0 +1,51 @@
+import asyncio
+
+from CoreFunction.FileManager import FileManager
+from CoreFunction.ReplicatedRemoteManager import ReplicatedRemoteManager
+from JsonInterpreter import JsonInterpreter
+from SimulatedRemoteManager import SimulatedRemoteManager
+from TestFormat import TestFormat as Record # Not collected as a test class under this name
+
+
+class OtherHashRemote(SimulatedRemoteManager):
+    hash_scheme = "other"
+
+
+def test_hashes_dont_depend_on_the_replica():
+    async def run():
+        replicas = [SimulatedRemoteManager(), SimulatedRemoteManager()]
+        remote = ReplicatedRemoteManager(replicas, write_quorum=2)
+        await remote.create("a.json")
+        written = await remote.write("a.json", "contents")
+        remote.latencies[0].extend([1.0] * 20) # Reads now go to replica 1, writes answered from replica 0
+        assert await remote.content_hash("a.json") == written
+        assert remote.hash_scheme == "sha256"
+    asyncio.run(run())
+
+
+def test_mixed_hash_schemes_are_tagged_by_scheme():
+    async def run():
+        remote = ReplicatedRemoteManager([SimulatedRemoteManager(), OtherHashRemote()])
+        await remote.create("a.json")
+        written = await remote.write("a.json", "contents")
+        assert written.split(":")[0] in ("sha256", "other")
+        assert remote.hash_scheme == "replicated(other,sha256)"
+    asyncio.run(run())
+
+
+def test_manifest_hit_after_replicated_write(tmp_path):
+    async def run():
+        replicas = [SimulatedRemoteManager(), SimulatedRemoteManager()]
+        remote = ReplicatedRemoteManager(replicas, write_quorum=2)
+        file_manager = FileManager(JsonInterpreter(), tmp_path, remote)
+        for i in range(10):
+            await file_manager.write(f"f{i}", Record(info1="x", info2=i, info3=[]), create_if_none=True)
+        remote.latencies[0].extend([1.0] * 20) # So hashes are read from the other replica than the one that answered writes
+        for replica in replicas:
+            replica.reset_calls()
+        for i in range(10):
+            assert (await file_manager.read(f"f{i}")).info2 == i
+        # Every read is checked by its hash alone, nothing is downloaded to compare
+        assert sum(replica.calls["read"] + replica.calls["read_bytes"] for replica in replicas) == 0
+        await file_manager.aclose()
+    asyncio.run(run())
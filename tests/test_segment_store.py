@@ -0,0 +1,71 @@
+import sys
+import threading
+
+from CoreFunction.SegmentStore import SegmentStore
+
+
+def test_compaction_racing_concurrent_puts(tmp_path):
+    # Small segments, so puts keep opening new ones (adding to the segment sizes) while compaction walks them
+    store = SegmentStore(tmp_path, max_segment_bytes=4096, compact_ratio=0.3)
+    names = [f"record{i}" for i in range(50)]
+    latest = {}
+    errors = []
+    stop = threading.Event()
+
+    def writer(worker: int) -> None:
+        try:
+            for round_ in range(200):
+                for name in names[worker::4]:
+                    contents = f"{name}:{round_}".encode() * 4
+                    store.put(name, contents)
+                    latest[name] = contents
+        except Exception as e:
+            errors.append(e)
+
+    def compactor() -> None:
+        try:
+            while not stop.is_set():
+                store.compact()
+                for name in list(latest):
+                    store.stamp(name)
+                    store.exists(name)
+        except Exception as e:
+            errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # Switch threads as often as possible, so the race shows up
+    try:
+        writers = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+        compacting = threading.Thread(target=compactor)
+        compacting.start()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        compacting.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert not errors, errors
+    assert store.compactions > 0
+    for name in names:
+        assert store.get(name) == latest[name]
+    store.close()
+
+    reopened = SegmentStore(tmp_path, max_segment_bytes=4096)
+    for name in names:
+        assert reopened.get(name) == latest[name]
+    reopened.close()
+
+
+def test_compaction_recovers_from_a_leftover_segment(tmp_path):
+    store = SegmentStore(tmp_path, max_segment_bytes=256, compact_ratio=0.1)
+    for round_ in range(20):
+        store.put("a", f"{round_}".encode() * 20)
+    store.put("b", b"kept")
+    store.compact()
+    store.close()
+    reopened = SegmentStore(tmp_path, max_segment_bytes=256)
+    assert reopened.get("a") == b"19" * 20 and reopened.get("b") == b"kept"
+    reopened.close()
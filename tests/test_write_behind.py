@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from CoreFunction.FileManager import FileManager
+from CoreFunction.JsonJournal import JsonJournal
+from JsonInterpreter import JsonInterpreter
+from SimulatedRemoteManager import SimulatedRemoteManager
+from TestFormat import TestFormat as Record # Not collected as a test class under this name
+
+
+def leave_unsent(base_dir, names):
+    """What a crash leaves behind: local files, and journal entries saying they still have to be uploaded."""
+    interpreter = JsonInterpreter()
+    journal = JsonJournal(base_dir / FileManager.META_DIR_NAME / "write_behind.jsonl")
+    for i, name in enumerate(names):
+        (base_dir / name).write_text(interpreter.write(Record(info1="left", info2=i, info3=[])))
+        journal.set(name, {"op": "write", "since": time.time()})
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_resumes_from_a_leftover_journal_on_a_read(tmp_path):
+    names = [f"f{i}.json" for i in range(5)]
+    leave_unsent(tmp_path, names)
+
+    async def run():
+        remote = SimulatedRemoteManager()
+        file_manager = FileManager(JsonInterpreter(), tmp_path, remote, write_behind=True)
+        # Only reads, no writes or flush: the leftover uploads still have to go
+        assert (await file_manager.read("f0")).info1 == "left"
+        await wait_for(lambda: sorted(remote._names()) == names)
+        assert file_manager.write_behind.stats["depth"] == 0
+        await file_manager.aclose()
+
+    asyncio.run(run())
+    assert not list(JsonJournal(tmp_path / FileManager.META_DIR_NAME / "write_behind.jsonl").items())
+
+
+def test_write_then_delete_doesnt_fail_the_upload(tmp_path):
+    async def run():
+        remote = SimulatedRemoteManager()
+        file_manager = FileManager(JsonInterpreter(), tmp_path, remote, write_behind=True)
+        for i in range(20):
+            await file_manager.write(f"f{i}", Record(info1="x" * 100000, info2=i, info3=[]), create_if_none=True)
+            await file_manager.delete(f"f{i}")
+        await file_manager.flush()
+        assert file_manager.write_behind.failures == 0, file_manager.write_behind.last_error
+        assert remote._names() == []
+        await file_manager.aclose()
+
+    asyncio.run(run())